@@ -0,0 +1,83 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PERMANENT = math.inf
+
+
+class BanRegistry:
+    # Копия таблицы blocked_users в памяти: user_id -> момент окончания бана (unix time).
+    # Бессрочный бан хранится в БД как NULL, здесь — как PERMANENT
+    def __init__(self):
+        self._bans = {}
+        self._queue = []  # min-heap (ban_until, user_id) для планировщика снятия банов
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._bans)
+
+    def __contains__(self, user_id):
+        return self.is_blocked(user_id)
+
+    def load(self, rows):
+        self._bans.clear()
+        self._queue.clear()
+        for user_id, ban_until in rows:
+            self.add(user_id, ban_until)
+
+    def add(self, user_id, ban_until):
+        # ban_until — строка ISO из БД (или None для бессрочного бана)
+        until = datetime.fromisoformat(ban_until).timestamp() if ban_until else PERMANENT
+        self._bans[user_id] = until
+        if until is not PERMANENT:
+            if not self._queue or until < self._queue[0][0]:
+                self._wakeup.set()
+            heapq.heappush(self._queue, (until, user_id))
+
+    def remove(self, user_id):
+        # Запись в очереди остаётся и будет пропущена при извлечении
+        self._bans.pop(user_id, None)
+
+    def get(self, user_id):
+        return self._bans.get(user_id)
+
+    def is_blocked(self, user_id, now=None):
+        ban_until = self._bans.get(user_id)
+        if ban_until is None:
+            return False
+        return (time.time() if now is None else now) <= ban_until
+
+    def pop_expired(self, now):
+        expired = []
+        while self._queue and self._queue[0][0] < now:
+            until, user_id = heapq.heappop(self._queue)
+            # Бан мог быть снят или продлён после постановки в очередь
+            if self._bans.get(user_id) == until:
+                del self._bans[user_id]
+                expired.append(user_id)
+        return expired
+
+    async def run_expiry(self, on_expire, tick=1.0):
+        # Снимает истёкшие баны пачками: все сроки, попавшие в один тик, обрабатываются вместе
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            expired = self.pop_expired(now)
+            if expired:
+                try:
+                    await on_expire(expired)
+                except Exception as e:
+                    logger.error(f"Ошибка при снятии истёкших банов {expired}: {e}")
+            if self._queue:
+                delay = math.ceil(max(self._queue[0][0] - now, 0) / tick) * tick or tick
+            else:
+                delay = None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import timeit
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Сравнение маршрутизации кнопок: прежняя цепочка lambda-фильтров против CallbackRouter.
+# Запуск: python bench/callback_routing.py
+
+# Фильтры и разбор данных в том порядке, в каком они были зарегистрированы в bot.py
+LEGACY_CHAIN = [
+    (lambda c: c.data == "get_link", lambda d: None),
+    (lambda c: c.data.startswith("report_"), lambda d: int(d.split("_")[1])),
+    (lambda c: c.data.startswith("ban_"), lambda d: [int(p) for p in d.split("_")[1:4]]),
+    (lambda c: c.data.startswith("ignore_"), lambda d: int(d.split("_")[1])),
+    (lambda c: c.data == "admin_panel", lambda d: None),
+    (lambda c: c.data == "list_blocked" or c.data.startswith("blocked_page_"), lambda d: d.split("_")[2:]),
+    (lambda c: c.data == "list_reports" or c.data.startswith("reports_page_"), lambda d: d.split("_")[2:]),
+    (lambda c: c.data.startswith("manage_report_"), lambda d: [int(p) for p in d.split("_")[2:4]]),
+    (lambda c: c.data.startswith("manage_") and c.data.split("_")[1].isdigit(), lambda d: int(d.split("_")[1])),
+    (lambda c: c.data.startswith("edit_ban_") and len(c.data.split("_")) == 3, lambda d: int(d.split("_")[2])),
+    (lambda c: c.data.startswith("edit_ban_duration_") and len(c.data.split("_")) == 5,
+     lambda d: [int(p) for p in d.split("_")[3:5]]),
+    (lambda c: c.data.startswith("unblock_"), lambda d: int(d.split("_")[1])),
+    (lambda c: c.data == "manage_admins", lambda d: None),
+    (lambda c: c.data.startswith("remove_admin_"), lambda d: int(d.split("_")[2])),
+    (lambda c: c.data == "back_to_menu", lambda d: None),
+    (lambda c: c.data == "cancel_input", lambda d: None),
+]
+
+LEGACY_DATA = [
+    "get_link", "report_123456", "ban_987654321_123456_24", "ignore_123456", "admin_panel", "list_blocked",
+    "blocked_page_n_987654321", "list_reports", "reports_page_p_123456", "manage_report_987654321_123456",
+    "manage_987654321", "edit_ban_987654321", "edit_ban_duration_987654321_168", "unblock_987654321",
+    "manage_admins", "remove_admin_987654321", "back_to_menu", "cancel_input",
+]
+
+
+def legacy_resolve(data):
+    call = SimpleNamespace(data=data)
+    for check, parse in LEGACY_CHAIN:
+        if check(call):
+            return parse(data)
+    return None
+
+
+def main():
+    os.chdir(tempfile.mkdtemp(prefix="bot-bench-"))
+    os.environ["TOKEN"] = "123456:BENCH"
+    os.environ["ADMIN_ID"] = "1"
+    import bot
+    from callbacks import parse_legacy
+
+    router = bot.callback_router
+    # Те же кнопки в новом формате
+    new_data = [d if ":" not in d and parse_legacy(d) is None else parse_legacy(d).pack() for d in LEGACY_DATA]
+    for data in new_data:
+        assert router.resolve(data) is not None, data
+
+    number = 20000
+    rounds = len(LEGACY_DATA) * number
+    print(f"{'routing':<28}{'ns/callback':>14}")
+    for name, func, dataset in [
+        ("lambda chain (old data)", legacy_resolve, LEGACY_DATA),
+        ("CallbackRouter (new data)", router.resolve, new_data),
+        ("CallbackRouter (old data)", router.resolve, LEGACY_DATA),
+    ]:
+        elapsed = min(timeit.repeat(lambda: [func(d) for d in dataset], number=number, repeat=3))
+        print(f"{name:<28}{elapsed / rounds * 1e9:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+# Локальная замена Bot API для нагрузочных тестов: отвечает на методы, которые вызывает бот,
+# с настраиваемой задержкой и долей ответов 429 Too Many Requests
+class FakeBotAPI:
+    def __init__(self, latency=0.0, flood_rate=0.0, retry_after=1, bot_username="bench_bot"):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.bot_username = bot_username
+        self.calls = Counter()
+        self.floods = 0
+        self._message_ids = itertools.count(1)
+        self._runner = None
+        self.url = None
+
+    def _message(self, chat_id, text=None):
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text,
+        }
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method != "getMe" and self.flood_rate and random.random() < self.flood_rate:
+            self.floods += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": self.bot_username}
+        elif method == "sendMessage":
+            result = self._message(params.get("chat_id", 0), params.get("text"))
+        elif method == "editMessageText":
+            result = self._message(params.get("chat_id", 0), params.get("text"))
+        elif method == "copyMessage":
+            result = {"message_id": next(self._message_ids)}
+        else:
+            # answerCallbackQuery и прочие методы, возвращающие True
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_api import FakeBotAPI  # noqa: E402
+
+ADMIN_ID = 1
+
+# Нагрузочный тест: реальный dp из bot.py против локального FakeBotAPI.
+# Запуск: python bench/run.py --owners 50 --senders 200 --latency 20
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Workload:
+    def __init__(self, bot_module):
+        self.B = bot_module
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.latencies = []
+        self.chat_latencies = {}
+        self.errors = 0
+        # Время апдейта от приёма до конца обработки; ошибки обработчиков не выходят из UpdateExecutor,
+        # поэтому считаем их здесь (например, 429 на прямом вызове API из обработчика)
+        executor = bot_module.executor
+        original = executor.submit
+
+        def submit(key, run):
+            accepted = time.perf_counter()
+
+            async def timed():
+                try:
+                    await run()
+                except Exception:
+                    self.errors += 1
+                finally:
+                    latency = time.perf_counter() - accepted
+                    self.latencies.append(latency)
+                    self.chat_latencies.setdefault(key, []).append(latency)
+            return original(key, timed)
+        executor.submit = submit
+
+    def _user(self, user_id):
+        from aiogram import types
+        return types.User(id=user_id, is_bot=False, first_name=f"user{user_id}")
+
+    def message(self, user_id, text):
+        from aiogram import types
+        return types.Update(update_id=next(self.update_ids), message=types.Message(
+            message_id=next(self.message_ids), date=datetime.now(),
+            chat=types.Chat(id=user_id, type="private"), from_user=self._user(user_id), text=text))
+
+    def callback(self, user_id, data):
+        from aiogram import types
+        return types.Update(update_id=next(self.update_ids), callback_query=types.CallbackQuery(
+            id=str(next(self.update_ids)), chat_instance="bench", data=data, from_user=self._user(user_id),
+            message=types.Message(message_id=next(self.message_ids), date=datetime.now(),
+                                  chat=types.Chat(id=user_id, type="private"), text="bench")))
+
+    async def run(self, streams):
+        # streams — список последовательностей апдейтов, поступающих разом, как пачка от getUpdates.
+        # Апдейты одного пользователя UpdateExecutor обрабатывает по очереди, разных — параллельно
+        self.latencies = []
+        self.chat_latencies = {}
+        self.errors = 0
+        shed = metrics_total(self.B.metrics.updates_shed)
+        started = time.perf_counter()
+        for stream in streams:
+            for update in stream:
+                await self.B.dp.feed_update(self.B.bot, update)
+        await self.B.executor.join()
+        # Доставка анонимных сообщений идёт фоновыми задачами уже после обработчика
+        if self.B.background_tasks:
+            await asyncio.wait(self.B.background_tasks)
+        elapsed = time.perf_counter() - started
+        return self.latencies, self.errors, metrics_total(self.B.metrics.updates_shed) - shed, elapsed
+
+
+def metrics_total(counter):
+    return sum(counter._values.values())
+
+
+class DBTimer:
+    # Считает время, которое запросы провели в потоке БД (без ожидания в очереди)
+    def __init__(self, db):
+        self.total = 0.0
+        self.calls = 0
+        original = db._run
+
+        def measured(func, *args):
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.total += time.perf_counter() - started
+                self.calls += 1
+
+        async def timed(func, *args):
+            return await original(measured, func, *args)
+        db._run = timed
+
+    def reset(self):
+        self.total = 0.0
+        self.calls = 0
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    os.chdir(workdir)
+    os.environ["TOKEN"] = "123456:BENCH"
+    os.environ["ADMIN_ID"] = str(ADMIN_ID)
+
+    api = FakeBotAPI(latency=args.latency / 1000, flood_rate=args.flood_rate)
+    url = await api.start(port=args.port)
+
+    import logging
+    import bot as B
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("aiogram.event").setLevel(logging.CRITICAL)  # ошибки обработчиков считаются в errors
+    logging.getLogger("executor").setLevel(logging.CRITICAL)
+
+    B.bot.session = AiohttpSession(api=TelegramAPIServer.from_base(url))
+    if args.global_rate:
+        B.delivery.set_rate(args.global_rate)
+    if args.chat_rate:
+        B.delivery.per_chat_interval = 1 / args.chat_rate
+    B.executor.concurrency = args.concurrency
+    if args.queue_limit:
+        B.executor.limit = args.queue_limit
+    await B.init_db()
+    B.delivery.start()
+    B.executor.start()
+    B.storage.start()
+    B.bot_username = (await B.bot.get_me()).username
+    timer = DBTimer(B.db)
+    work = Workload(B)
+
+    owners = list(range(1000, 1000 + args.owners))
+    senders = list(range(100000, 100000 + args.senders))
+    results = []
+
+    async def phase(name, streams):
+        timer.reset()
+        latencies, errors, shed, elapsed = await work.run(streams)
+        results.append((name, len(latencies), errors, shed, elapsed, latencies, timer.total, timer.calls))
+
+    def chats_row(name, chat_ids):
+        # Строка отчёта по апдейтам только этих чатов из предыдущего сценария
+        latencies = [latency for chat_id in chat_ids for latency in work.chat_latencies.get(chat_id, [])]
+        results.append((name, len(latencies), 0, 0, max(latencies, default=1), latencies, 0.0, 0))
+
+    await phase("start", [[work.message(user_id, "/start")] for user_id in owners])
+    links = {user_id: await B.get_or_create_user_link(user_id) for user_id in owners}
+
+    await phase("anon_message", [
+        [work.message(sender, f"/start {links[owners[i % len(owners)]]}"),
+         work.message(sender, f"Анонимное сообщение #{i}")]
+        for i, sender in enumerate(senders)
+    ])
+
+    # Один популярный получатель: доставка ему идёт со скоростью лимита чата, а /start остальных
+    # пользователей, пришедший следом, не должен ждать её в очереди апдейтов
+    if args.hot_senders:
+        hot_senders = list(range(200000, 200000 + args.hot_senders))
+        bystanders = owners[1:]
+        await work.run([[work.message(sender, f"/start {links[owners[0]]}")] for sender in hot_senders])
+        await phase("hot_owner", [[work.message(sender, f"Популярному #{i}")] for i, sender in enumerate(hot_senders)]
+                    + [[work.message(user_id, "/start")] for user_id in bystanders])
+        chats_row("  bystanders", bystanders)
+
+    rows = await B.db.fetchall("SELECT id, link_owner_id FROM messages ORDER BY id LIMIT ?", (args.reports,))
+    await phase("report", [[work.callback(owner_id, f"report_{msg_id}")] for msg_id, owner_id in rows])
+
+    admin_streams = [[work.callback(ADMIN_ID, "admin_panel"), work.callback(ADMIN_ID, "list_reports"),
+                      work.callback(ADMIN_ID, "list_blocked")] for _ in range(args.admin_rounds)]
+    admin_streams += [[work.callback(ADMIN_ID, f"ban_{senders[i]}_{msg_id}_1")]
+                      for i, (msg_id, _) in enumerate(rows[:args.bans])]
+    await phase("admin", admin_streams)
+
+    await B.executor.close()
+    await B.delivery.close()
+    await B.storage.close()
+    await B.db.close()
+    await B.bot.session.close()
+    await api.stop()
+
+    print(f"{'phase':<14}{'updates':>9}{'errors':>8}{'shed':>6}{'upd/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'db ms':>10}{'db calls':>10}")
+    for name, count, errors, shed, elapsed, latencies, db_total, db_calls in results:
+        print(f"{name:<14}{count:>9}{errors:>8}{shed:>6}{count / elapsed:>10.1f}"
+              f"{percentile(latencies, 50) * 1000:>10.2f}"
+              f"{percentile(latencies, 99) * 1000:>10.2f}{db_total * 1000:>10.1f}{db_calls:>10}")
+    print(f"API calls: {dict(api.calls)}, 429 injected: {api.floods}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальном Bot API")
+    parser.add_argument("--owners", type=int, default=50, help="владельцев ссылок")
+    parser.add_argument("--senders", type=int, default=200, help="отправителей анонимных сообщений")
+    parser.add_argument("--hot-senders", type=int, default=40,
+                        help="отправителей одному популярному получателю (0 — без этого сценария)")
+    parser.add_argument("--reports", type=int, default=50, help="жалоб")
+    parser.add_argument("--bans", type=int, default=10, help="банов по жалобам")
+    parser.add_argument("--admin-rounds", type=int, default=20, help="проходов по админ-панели")
+    parser.add_argument("--concurrency", type=int, default=16, help="апдейтов в обработке одновременно")
+    parser.add_argument("--queue-limit", type=int, default=0,
+                        help="переопределить размер очереди апдейтов (по умолчанию как в боте)")
+    parser.add_argument("--latency", type=float, default=0, help="задержка ответа Bot API, мс")
+    parser.add_argument("--flood-rate", type=float, default=0, help="доля ответов 429 (0..1)")
+    parser.add_argument("--global-rate", type=float, default=0,
+                        help="переопределить общий лимит отправки, сообщений/с (по умолчанию как в боте)")
+    parser.add_argument("--chat-rate", type=float, default=0,
+                        help="переопределить лимит отправки в один чат, сообщений/с")
+    parser.add_argument("--port", type=int, default=0, help="порт локального Bot API (0 — любой свободный)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
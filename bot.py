@@ -2,17 +2,36 @@ import sqlite3
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.types import InlineKeyboardButton
 from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 import asyncio
-from uuid import uuid4
 import logging
 from datetime import datetime, timedelta
+from html import escape
 from dotenv import load_dotenv
 import os
-from logger_config import setup_logger
+import secrets
+from logger_config import setup_logger, shutdown_logger
+from database import Database
+from bans import BanRegistry, PERMANENT
+from delivery import DeliveryQueue, GLOBAL_RATE
+from storage import SQLiteStorage
+from throttling import FloodControl
+from executor import STOP_TIMEOUT, UpdateExecutor
+from broadcast import Broadcaster
+from links import LinkCodec, MAX_CODE_LENGTH, generate_key
+from sharding import Ingress, consume
+import metrics
+import retention
+import webhook
+from fingerprints import DuplicateIndex, fingerprint
+from search import build_query, highlight, parse_query
+from stats import Stats
+import callbacks as cb
+from callbacks import CallbackRouter
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -23,134 +42,199 @@ logger = setup_logger()
 # Конфигурация
 TOKEN = os.getenv("TOKEN")
 ADMIN_ID = os.getenv("ADMIN_ID")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 — эндпоинт метрик выключен
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный https-адрес; если задан — режим вебхука вместо polling
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)  # без значения — новый при каждом запуске
+WORKERS = int(os.getenv("WORKERS", "1"))  # больше 1 — процесс-приёмник и воркеры, апдейты делятся по user_id
+SHARED_SYNC_INTERVAL = 1.0  # как часто воркер проверяет изменения банов и админов из других процессов, сек
 bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-dp = Dispatcher()
+db = Database()
+storage = SQLiteStorage(db)  # FSM-состояния хранятся в БД и переживают перезапуск
+dp = Dispatcher(storage=storage)
+dp.message.middleware(metrics.MetricsMiddleware())
+callback_router = CallbackRouter()  # кнопки разбираются здесь; время обработчиков кнопок пишет он же
+stats = Stats(db)  # счётчики админ-панели, ведутся на путях записи
+delivery = DeliveryQueue(bot)  # все исходящие bot.send_message идут через очередь с лимитами
+executor = UpdateExecutor(delivery)  # апдейты обрабатываются ограниченным числом задач, по чату — по порядку
+dp.update.outer_middleware(executor)
+broadcaster = Broadcaster(db, delivery)
 bot_username = None
+PAGE_SIZE = 10  # строк на странице в списках админ-панели
+background_tasks = set()
 
 # Определение состояний
 class UserState(StatesGroup):
     waiting_for_anon_message = State()
     waiting_for_admin_id = State()
     waiting_for_ban_duration = State()  # Можно удалить, если не нужен текстовый ввод
+    waiting_for_broadcast = State()
+
+# Ограничение частоты анонимных сообщений до обращения к БД и Telegram
+dp.message.middleware(FloodControl(delivery))
 
 # База данных
-def init_db():
+bans = BanRegistry()
+admin_ids = set()  # Кэш таблицы admins, обновляется при каждой записи
+duplicates = DuplicateIndex()  # Недавние отпечатки содержимого для отсева массовых рассылок
+link_codec = None  # Кодирование user_id в код ссылки, ключ хранится в settings
+shared_version = 0  # Версия банов и админов в БД, с которой совпадают кэши в памяти
+
+async def init_db():
+    global link_codec
     try:
-        with sqlite3.connect('bot.db') as conn:
-            c = conn.cursor()
-            c.execute('''CREATE TABLE IF NOT EXISTS users 
-                         (user_id INTEGER PRIMARY KEY, unique_link TEXT UNIQUE)''')
-            c.execute('''CREATE TABLE IF NOT EXISTS messages 
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                          link_owner_id INTEGER, 
-                          sender_id INTEGER,
-                          message TEXT, 
-                          is_reported INTEGER DEFAULT 0)''')
-            c.execute('''CREATE TABLE IF NOT EXISTS admins 
-                         (admin_id INTEGER PRIMARY KEY)''')
-            c.execute('''CREATE TABLE IF NOT EXISTS blocked_users 
-                         (user_id INTEGER PRIMARY KEY, ban_until TEXT)''')
-            c.execute("PRAGMA table_info(blocked_users)")
-            columns = [col[1] for col in c.fetchall()]
-            if 'ban_until' not in columns:
-                c.execute("ALTER TABLE blocked_users ADD COLUMN ban_until TEXT")
-                logger.info("Added column 'ban_until' to blocked_users table")
-            c.execute("INSERT OR IGNORE INTO admins (admin_id) VALUES (?)", (ADMIN_ID,))
+        await db.connect()
+        await db.init_db(ADMIN_ID)
+        link_codec = LinkCodec(await db.get_or_create_setting("link_key", generate_key()))
+        await load_shared_state()
+        await stats.load()
     except sqlite3.Error as e:
         logger.error(f"Database initialization error: {e}")
         raise
 
+async def load_shared_state():
+    global shared_version
+    shared_version = await db.get_shared_version()
+    bans.load(await db.get_blocked_users())
+    admin_ids.clear()
+    admin_ids.update(await db.get_admins())
+
+async def sync_shared_state():
+    # В режиме воркеров баны и админы могут измениться в другом процессе
+    while True:
+        await asyncio.sleep(SHARED_SYNC_INTERVAL)
+        try:
+            if await db.get_shared_version() != shared_version:
+                await load_shared_state()
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации банов и админов: {e}")
+
 def is_admin(user_id):
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("SELECT admin_id FROM admins WHERE admin_id=?", (user_id,))
-        return c.fetchone() is not None
+    return user_id in admin_ids
 
-def add_admin(admin_id):
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("INSERT OR IGNORE INTO admins (admin_id) VALUES (?)", (admin_id,))
+async def add_admin(admin_id):
+    await db.add_admin(admin_id)
+    admin_ids.add(admin_id)
 
-def remove_admin(admin_id):
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM admins WHERE admin_id=?", (admin_id,))
+async def remove_admin(admin_id):
+    await db.remove_admin(admin_id)
+    admin_ids.discard(admin_id)
 
 def get_admins():
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("SELECT admin_id FROM admins")
-        return [row[0] for row in c.fetchall()]
+    return sorted(admin_ids)
 
 def is_user_blocked(user_id):
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("SELECT ban_until FROM blocked_users WHERE user_id=?", (user_id,))
-        result = c.fetchone()
-        if result and result[0]:
-            ban_until = datetime.fromisoformat(result[0])
-            if datetime.now() > ban_until:
-                unblock_user(user_id)
-                return False
-            return True
-        return False
+    # Только чтение реестра: истёкшие баны снимает планировщик expire_bans
+    return bans.is_blocked(user_id)
 
-def block_user(user_id, duration_hours):
+async def block_user(user_id, duration_hours):
+    # duration_hours == 0 — бессрочный бан (ban_until = NULL)
     if is_admin(user_id):
         return False
-    
-    ban_until = (datetime.now() + timedelta(hours=duration_hours)).isoformat()
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("INSERT OR REPLACE INTO blocked_users (user_id, ban_until) VALUES (?, ?)", 
-                  (user_id, ban_until))
-
-def unblock_user(user_id):
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM blocked_users WHERE user_id=?", (user_id,))
-    asyncio.create_task(notify_unblock(user_id))
+
+    ban_until = (datetime.now() + timedelta(hours=duration_hours)).isoformat() if duration_hours else None
+    await db.block_user(user_id, ban_until)
+    bans.add(user_id, ban_until)
+
+async def unblock_user(user_id):
+    await db.unblock_user(user_id)
+    bans.remove(user_id)
+    # Уведомление идёт в фоне: нажатие админа не ждёт очереди отправки в чужой чат
+    spawn(notify_unblock(user_id))
+
+async def expire_bans(user_ids):
+    await db.unblock_expired(user_ids, datetime.now().isoformat())
+    logger.info(f"Сняты истёкшие баны: {user_ids}")
+    await asyncio.gather(*(notify_unblock(user_id) for user_id in user_ids), return_exceptions=True)
 
 async def notify_unblock(user_id):
     try:
-        await bot.send_message(user_id, "<b>✅ Ваш бан истёк</b>, вы снова можете использовать бота!")
-    except TelegramBadRequest as e:
+        await delivery.send_message(user_id, "<b>✅ Ваш бан истёк</b>, вы снова можете использовать бота!")
+    except TelegramAPIError as e:
+        # В том числе TelegramForbiddenError: забаненные часто блокируют бота
         logger.error(f"Failed to notify user {user_id} about unblock: {e}")
 
-def get_blocked_users():
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("SELECT user_id, ban_until FROM blocked_users")
-        return c.fetchall()
-
-def get_reported_messages():
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("SELECT id, link_owner_id, sender_id, message FROM messages WHERE is_reported=1")
-        return c.fetchall()
+def spawn(coro):
+    # Фоновая задача со ссылкой, чтобы её не собрал сборщик мусора
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
 
-def get_or_create_user_link(user_id):
+async def get_or_create_user_link(user_id):
     try:
-        with sqlite3.connect('bot.db') as conn:
-            c = conn.cursor()
-            c.execute("SELECT unique_link FROM users WHERE user_id=?", (user_id,))
-            result = c.fetchone()
-            if not result:
-                unique_link = str(uuid4()).replace('-', '')
-                c.execute("INSERT INTO users (user_id, unique_link) VALUES (?, ?)", (user_id, unique_link))
-            else:
-                unique_link = result[0]
-            return unique_link
+        if not await db.user_exists(user_id):
+            await db.add_user(user_id)
+            stats.user_added()
+        return link_codec.encode(user_id)
     except sqlite3.Error as e:
         logger.error(f"Database error in get_or_create_user_link: {e}")
         return None
 
-def get_link_owner(unique_link):
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("SELECT user_id FROM users WHERE unique_link=?", (unique_link,))
-        result = c.fetchone()
-        return result[0] if result else None
+async def get_link_owner(unique_link):
+    # Короткий код декодируется в user_id, остаётся проверить первичный ключ
+    if len(unique_link) <= MAX_CODE_LENGTH:
+        owner_id = link_codec.decode(unique_link)
+        return owner_id if owner_id is not None and await db.user_exists(owner_id) else None
+    return await db.get_legacy_link_owner(unique_link)
+
+# Пересылка сообщений любых типов
+ANON_HEADER = "<b>✨ Новое анонимное сообщение:</b>"
+CAPTION_TYPES = {"photo", "video", "animation", "audio", "document", "voice"}  # типы с подписью
+CAPTION_LIMIT = 1024
+
+def describe_message(content_type, text):
+    # Текст сообщения для админов (экранирован для HTML); вложения обозначаются типом
+    text = escape(text or "")
+    if content_type in (None, "text"):
+        return text
+    return f"[{content_type}] {text}" if text else f"[{content_type}]"
+
+async def relay_message(owner_id, message: types.Message, msg_id):
+    # Текст отправляется заново, всё остальное копируется на стороне Telegram по chat_id и message_id
+    markup = get_report_button(msg_id)
+    if message.content_type == "text":
+        await delivery.send_message(owner_id, f"{ANON_HEADER}\n{message.html_text}", reply_markup=markup)
+        return
+    caption = f"{ANON_HEADER}\n{message.html_text}" if message.caption else ANON_HEADER
+    if message.content_type in CAPTION_TYPES and len(caption) <= CAPTION_LIMIT:
+        await delivery.copy_message(owner_id, message.chat.id, message.message_id, caption=caption,
+                                    reply_markup=markup)
+        return
+    # Заголовок отдельным сообщением: очередь доставки сохраняет порядок внутри чата
+    header = delivery.send_message(owner_id, ANON_HEADER)
+    try:
+        await delivery.copy_message(owner_id, message.chat.id, message.message_id, reply_markup=markup)
+    except Exception:
+        # Без вложения заголовок лишний: неотправленный отменяем, отправленный удаляем
+        if not header.cancel() and not header.cancelled() and header.exception() is None:
+            try:
+                await bot.delete_message(owner_id, header.result().message_id)
+            except TelegramAPIError as e:
+                logger.warning(f"Не удалось удалить заголовок недоставленного сообщения в чате {owner_id}: {e}")
+        raise
+    await header
+
+async def deliver_message(owner_id, message: types.Message, msg_id):
+    # Идёт отдельной задачей: ожидание лимита чужого чата не занимает обработчик апдейтов
+    try:
+        try:
+            await relay_message(owner_id, message, msg_id)
+        except TelegramAPIError as e:
+            # В том числе TelegramForbiddenError — получатель заблокировал бота
+            logger.error(f"Не удалось отправить сообщение получателю {owner_id}: {e}")
+            stats.delivery_failed()
+            # Можно удалить сообщение из БД, так как оно не было доставлено
+            await db.delete_message(msg_id)
+            await message.answer("<b>❌ Не удалось отправить сообщение получателю</b>")
+            return
+        stats.message_sent()
+        await message.answer("<b>✅ Сообщение отправлено!</b>", reply_markup=get_main_menu(is_admin(message.from_user.id)))
+    except Exception as e:
+        logger.error(f"Неизвестная ошибка при доставке сообщения {msg_id}: {e}")
 
 # Клавиатуры
 def get_main_menu(is_admin=False):
@@ -163,7 +247,7 @@ def get_main_menu(is_admin=False):
 
 def get_report_button(msg_id):
     builder = InlineKeyboardBuilder()
-    builder.button(text="🚫 Пожаловаться", callback_data=f"report_{msg_id}")
+    builder.button(text="🚫 Пожаловаться", callback_data=cb.Report(msg_id=msg_id).pack())
     return builder.as_markup()
 
 def get_admin_panel():
@@ -175,30 +259,45 @@ def get_admin_panel():
     builder.adjust(1)
     return builder.as_markup()
 
-def get_ban_duration_panel(sender_id, msg_id):
+def get_admin_stats_text():
+    # Только счётчики в памяти — без запросов к БД, сколько бы ни было строк в таблицах
+    counters = stats.snapshot()
+    return (
+        "<b>👨‍💼 Админ-панель:</b>\n\n"
+        f"👥 Пользователей: {counters['users']}\n"
+        f"✉️ Сообщений сегодня: {counters['messages_today']}, за этот час: {counters['messages_hour']}\n"
+        f"📩 Открытых жалоб: {counters['open_reports']}\n"
+        f"🚫 Активных банов: {len(bans)}\n"
+        f"⚠️ Не доставлено анонимных сообщений сегодня: {counters['delivery_failures_today']}"
+    )
+
+def get_ban_duration_panel(sender_id, msg_id, with_history=False):
     builder = InlineKeyboardBuilder()
-    builder.button(text="1 час", callback_data=f"ban_{sender_id}_{msg_id}_1")
-    builder.button(text="24 часа", callback_data=f"ban_{sender_id}_{msg_id}_24")
-    builder.button(text="7 дней", callback_data=f"ban_{sender_id}_{msg_id}_168")
-    builder.button(text="Навсегда", callback_data=f"ban_{sender_id}_{msg_id}_0")
-    builder.button(text="Игнорировать", callback_data=f"ignore_{msg_id}")
+    builder.button(text="1 час", callback_data=cb.Ban(user_id=sender_id, msg_id=msg_id, hours=1).pack())
+    builder.button(text="24 часа", callback_data=cb.Ban(user_id=sender_id, msg_id=msg_id, hours=24).pack())
+    builder.button(text="7 дней", callback_data=cb.Ban(user_id=sender_id, msg_id=msg_id, hours=168).pack())
+    builder.button(text="Навсегда", callback_data=cb.Ban(user_id=sender_id, msg_id=msg_id, hours=0).pack())
+    builder.button(text="Игнорировать", callback_data=cb.Ignore(msg_id=msg_id).pack())
+    if with_history:
+        builder.button(text="🔎 Все жалобы на отправителя",
+                       callback_data=cb.SenderReports(sender_id=sender_id, offset=0).pack())
     builder.adjust(2)
     return builder.as_markup()
 
 def get_edit_ban_duration_panel(user_id):
     builder = InlineKeyboardBuilder()
-    builder.button(text="1 час", callback_data=f"edit_ban_duration_{user_id}_1")
-    builder.button(text="24 часа", callback_data=f"edit_ban_duration_{user_id}_24")
-    builder.button(text="7 дней", callback_data=f"edit_ban_duration_{user_id}_168")
-    builder.button(text="Навсегда", callback_data=f"edit_ban_duration_{user_id}_0")
-    builder.button(text="🔙 Назад", callback_data=f"manage_{user_id}")
+    builder.button(text="1 час", callback_data=cb.EditBanDuration(user_id=user_id, hours=1).pack())
+    builder.button(text="24 часа", callback_data=cb.EditBanDuration(user_id=user_id, hours=24).pack())
+    builder.button(text="7 дней", callback_data=cb.EditBanDuration(user_id=user_id, hours=168).pack())
+    builder.button(text="Навсегда", callback_data=cb.EditBanDuration(user_id=user_id, hours=0).pack())
+    builder.button(text="🔙 Назад", callback_data=cb.ManageBlocked(user_id=user_id).pack())
     builder.adjust(2)
     return builder.as_markup()
 
 def get_blocked_user_panel(user_id):
     builder = InlineKeyboardBuilder()
-    builder.button(text="✏️ Изменить срок", callback_data=f"edit_ban_{user_id}")
-    builder.button(text="✅ Разблокировать", callback_data=f"unblock_{user_id}")
+    builder.button(text="✏️ Изменить срок", callback_data=cb.EditBan(user_id=user_id).pack())
+    builder.button(text="✅ Разблокировать", callback_data=cb.Unblock(user_id=user_id).pack())
     builder.button(text="🔙 Назад", callback_data="list_blocked")
     builder.adjust(1)
     return builder.as_markup()
@@ -207,7 +306,7 @@ def get_admin_list_keyboard():
     builder = InlineKeyboardBuilder()
     admins = get_admins()
     for admin_id in admins:
-        builder.button(text=f"Удалить {admin_id}", callback_data=f"remove_admin_{admin_id}")
+        builder.button(text=f"Удалить {admin_id}", callback_data=cb.RemoveAdmin(admin_id=admin_id).pack())
     builder.button(text="🔙 Назад", callback_data="admin_panel")
     builder.adjust(1)
     return builder.as_markup()
@@ -223,16 +322,20 @@ async def start_command(message: types.Message, state: FSMContext):
         if is_user_blocked(user_id):
             await message.answer("<b>🚫 Вы заблокированы</b> и не можете использовать бота!")
             return
-            
+
+        # /start после блокировки бота снова включает пользователя в рассылки
+        await db.mark_user_active(user_id)
+
         if len(args) == 1:
             try:
-                unique_link = get_or_create_user_link(user_id)
+                unique_link = await get_or_create_user_link(user_id)
                 if not unique_link:
                     await message.answer("<b>❌ Ошибка при создании ссылки</b>")
                     return
                     
                 link = f"https://t.me/{bot_username}?start={unique_link}"
-                admin_hint = "<b>Вы админ.</b> Используйте /add_admin для добавления администраторов." if is_admin(user_id) else ""
+                admin_hint = ("<b>Вы админ.</b> Используйте /add_admin для добавления администраторов "
+                              "и /broadcast для рассылки." if is_admin(user_id) else "")
                 text = (
                     f"<b>👋 Добро пожаловать!</b>\n\n"
                     f"Я помогу вам получать анонимные сообщения.\n\n"
@@ -252,7 +355,7 @@ async def start_command(message: types.Message, state: FSMContext):
         else:
             try:
                 unique_link = args[1]
-                owner_id = get_link_owner(unique_link)
+                owner_id = await get_link_owner(unique_link)
                 if owner_id:
                     await message.answer("✍️ Напишите ваше анонимное сообщение:")
                     await state.set_state(UserState.waiting_for_anon_message)
@@ -269,7 +372,7 @@ async def start_command(message: types.Message, state: FSMContext):
         await message.answer("<b>❌ Произошла непредвиденная ошибка</b>")
         await state.clear()
 
-@dp.message(UserState.waiting_for_anon_message)
+@dp.message(UserState.waiting_for_anon_message, flags={"flood_control": True})
 async def process_message(message: types.Message, state: FSMContext):
     try:
         user_id = message.from_user.id
@@ -279,110 +382,114 @@ async def process_message(message: types.Message, state: FSMContext):
             return
         data = await state.get_data()
         owner_id = data.get("owner_id")
-        
+
+        # Одно и то же содержимое от одного или разных отправителей пропускается ограниченное число раз
+        content_fp = fingerprint(message)
+        if not duplicates.allow(content_fp):
+            metrics.duplicates_dropped.inc()
+            await message.answer("<b>🚫 Такое сообщение уже массово рассылается</b> и не будет доставлено")
+            await state.clear()
+            return
+
         try:
-            with sqlite3.connect('bot.db') as conn:
-                c = conn.cursor()
-                c.execute("INSERT INTO messages (link_owner_id, sender_id, message) VALUES (?, ?, ?)",
-                          (owner_id, user_id, message.text))
-                msg_id = c.lastrowid
+            msg_id = await db.add_message(owner_id, user_id, message.text or message.caption, message.content_type,
+                                          message.chat.id, message.message_id, content_fp)
         except sqlite3.Error as e:
             logger.error(f"Ошибка базы данных при  сохранении сообщения: {e}")
             await message.answer("<b>❌ Произошла ошибка при сохранении сообщения</b>")
             return
 
-        try:
-            await bot.send_message(owner_id, f"<b>✨ Новое анонимное сообщение:</b>\n{message.text}", 
-                                 reply_markup=get_report_button(msg_id))
-        except TelegramBadRequest as e:
-            logger.error(f"Не удалось отправить сообщение получателю {owner_id}: {e}")
-            # Можно удалить сообщение из БД, так как оно не было доставлено
-            with sqlite3.connect('bot.db') as conn:
-                c = conn.cursor()
-                c.execute("DELETE FROM messages WHERE id=?", (msg_id,))
-            await message.answer("<b>❌ Не удалось отправить сообщение получателю</b>")
-            return
-
-        await message.answer("<b>✅ Сообщение отправлено!</b>", reply_markup=get_main_menu(is_admin(user_id)))
         await state.clear()
+        # Получателю — не чаще сообщения в секунду: при многих отправителях ожидание долгое,
+        # поэтому доставка и ответ отправителю идут после освобождения обработчика
+        spawn(deliver_message(owner_id, message, msg_id))
     except Exception as e:
         logger.error(f"Неизвестная ошибка в process_message: {e}")
         await message.answer("<b>❌ Произошла непредвиденная ошибка</b>")
         await state.clear()
 
-@dp.callback_query(lambda c: c.data == "get_link")
+@callback_router.register("get_link")
 async def get_link(call: types.CallbackQuery):
     user_id = call.from_user.id
     if is_user_blocked(user_id):
         await call.message.edit_text("<b>🚫 Вы заблокированы</b> и не можете использовать бота!")
         await call.answer()
         return
-    unique_link = get_or_create_user_link(user_id)
+    unique_link = await get_or_create_user_link(user_id)
     link = f"https://t.me/{bot_username}?start={unique_link}"
     text = f"📎 Ваша ссылка:\n<a href='{link}'>{link}</a>"
     await call.message.answer(text, reply_markup=get_main_menu(is_admin(user_id)), disable_web_page_preview=True)
     await call.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("report_"))
-async def process_report(call: types.CallbackQuery):
+@callback_router.register(cb.Report)
+async def process_report(call: types.CallbackQuery, callback_data: cb.Report):
     try:
-        msg_id = int(call.data.split("_")[1])
+        msg_id = callback_data.msg_id
         try:
-            with sqlite3.connect('bot.db') as conn:
-                c = conn.cursor()
-                c.execute("SELECT link_owner_id, sender_id, message FROM messages WHERE id=?", (msg_id,))
-                result = c.fetchone()
-                c.execute("UPDATE messages SET is_reported=1 WHERE id=?", (msg_id,))
+            result = await db.report_message(msg_id)
         except sqlite3.Error as e:
             logger.error(f"Ошибка базы данных при обработке жалобы на сообщение {msg_id}):  {e}")
             await call.answer("❌ Ошибка при обработке жалобы", show_alert=True)
             return
 
         if result:
-            owner_id, sender_id, reported_message = result
+            owner_id, sender_id, reported_message, already_reported, content_type, chat_id, source_id, copies = result
+            # Повторные жалобы на то же сообщение не рассылаются администраторам снова
+            if already_reported:
+                await call.answer("✅ Жалоба на это сообщение уже отправлена")
+                return
+            stats.report_opened()
+            # Жалоба на копию уже известного содержимого попадает в ту же группу без нового уведомления
+            if copies:
+                await call.answer()
+                await call.message.edit_text("<b>✅ Жалоба отправлена!</b>",
+                                             reply_markup=get_main_menu(is_admin(call.from_user.id)))
+                return
             notification_text = (
                 f"<b>🚨 Новая жалоба!</b>\n"
                 f"Владелец ссылки: {owner_id}\n"
                 f"Отправитель: {sender_id}\n"
-                f"Сообщение: {reported_message}"
+                f"Сообщение: {describe_message(content_type, reported_message)}"
             )
-            
-            notification_sent = False
-            for admin_id in get_admins():
-                try:
-                    await bot.send_message(admin_id, notification_text, 
-                                         reply_markup=get_ban_duration_panel(sender_id, msg_id))
-                    notification_sent = True
-                except TelegramBadRequest as e:
-                    logger.error(f"Ошибка от правления жалобы администратору {admin_id} на сообщение {msg_id}: {e}")
-                    
-            if not notification_sent:
-                await call.answer("❌ Не удалось уведомить администраторов", show_alert=True)
-                return
+            # Вложение показываем админам копией исходного сообщения
+            source = (chat_id, source_id) if content_type not in (None, "text") and chat_id else None
+            spawn(notify_admins(call.message, msg_id, notification_text,
+                                get_ban_duration_panel(sender_id, msg_id), source))
 
+        await call.answer()
         await call.message.edit_text("<b>✅ Жалоба отправлена!</b>", 
                                    reply_markup=get_main_menu(is_admin(call.from_user.id)))
-        await call.answer()
     except Exception as e:
         logger.error(f"Неизвестная ошибка при отправлении жалобы: {e}")
         await call.answer("❌ Произошла ошибка", show_alert=True)
 
-@dp.callback_query(lambda c: c.data.startswith("ban_"))
-async def handle_ban(call: types.CallbackQuery):
+async def notify_admins(report_message: types.Message, msg_id, text, reply_markup, source=None):
+    sent, failed = await delivery.fan_out(get_admins(), text, reply_markup=reply_markup)
+    if source and sent:
+        await delivery.fan_out_copy(sent, *source)
+    if failed:
+        logger.error(f"Жалоба на сообщение {msg_id} не доставлена администраторам {failed}")
+    if not sent:
+        try:
+            await report_message.edit_text("<b>❌ Не удалось уведомить администраторов</b>",
+                                           reply_markup=get_main_menu(is_admin(report_message.chat.id)))
+        except TelegramBadRequest as e:
+            logger.warning(f"Не удалось обновить сообщение о жалобе {msg_id}: {e}")
+
+@callback_router.register(cb.Ban)
+async def handle_ban(call: types.CallbackQuery, callback_data: cb.Ban):
     if not is_admin(call.from_user.id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    parts = call.data.split("_")
-    user_id, msg_id, duration = int(parts[1]), int(parts[2]), int(parts[3])
+    user_id, msg_id, duration = callback_data.user_id, callback_data.msg_id, callback_data.hours
     
     # Проверяем, не является ли пользователь администратором
     if is_admin(user_id):
         await call.answer("❌ Нельзя заблокировать администратора!", show_alert=True)
         return
         
-    duration_hours = duration if duration > 0 else 999999
-    ban_until = datetime.now() + timedelta(hours=duration_hours)
-    block_user(user_id, duration_hours)
+    ban_until = datetime.now() + timedelta(hours=duration)
+    await block_user(user_id, duration)
     
     if duration > 0:
         duration_text = f"{duration} час(ов), до {ban_until.strftime('%Y-%m-%d %H:%M')}"
@@ -390,31 +497,27 @@ async def handle_ban(call: types.CallbackQuery):
         duration_text = "навсегда"
     
     text = f"<b>🚫 Пользователь {user_id}</b> заблокирован на {duration_text}"
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM messages WHERE id=?", (msg_id,))
+    stats.reports_closed(await db.delete_report(msg_id))
     
     await call.message.edit_text(text)
     await call.answer(f"✅ Пользователь заблокирован на {duration_text}")
     
     try:
-        await bot.send_message(user_id, f"<b>🚫 Вы были заблокированы</b> на {duration_text}")
-    except TelegramBadRequest as e:
+        await delivery.send_message(user_id, f"<b>🚫 Вы были заблокированы</b> на {duration_text}")
+    except TelegramAPIError as e:
         logger.warning(f"Не удалось уведомить пользователя {user_id} о бане: {e}")
 
-@dp.callback_query(lambda c: c.data.startswith("ignore_"))
-async def ignore_report(call: types.CallbackQuery):
+@callback_router.register(cb.Ignore)
+async def ignore_report(call: types.CallbackQuery, callback_data: cb.Ignore):
     if not is_admin(call.from_user.id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    msg_id = int(call.data.split("_")[1])
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM messages WHERE id=?", (msg_id,))
+    msg_id = callback_data.msg_id
+    stats.reports_closed(await db.delete_report_group(msg_id))
     await call.message.edit_text("<b>✅ Жалоба проигнорирована и удалена</b>")
     await call.answer("✅ Жалоба проигнорирована")
 
-@dp.callback_query(lambda c: c.data == "admin_panel")
+@callback_router.register("admin_panel")
 async def admin_panel(call: types.CallbackQuery):
     user_id = call.from_user.id
     if is_user_blocked(user_id):
@@ -424,12 +527,12 @@ async def admin_panel(call: types.CallbackQuery):
     if not is_admin(user_id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    text = "<b>👨‍💼 Админ-панель:</b>"
-    await call.message.edit_text(text, reply_markup=get_admin_panel())
+    await call.message.edit_text(get_admin_stats_text(), reply_markup=get_admin_panel())
     await call.answer()
 
-@dp.callback_query(lambda c: c.data == "list_blocked")
-async def list_blocked(call: types.CallbackQuery):
+@callback_router.register("list_blocked")
+@callback_router.register(cb.BlockedPage)
+async def list_blocked(call: types.CallbackQuery, callback_data: cb.BlockedPage = None):
     user_id = call.from_user.id
     if is_user_blocked(user_id):
         await call.message.edit_text("<b>🚫 Вы заблокированы</b> и не можете использовать бота!")
@@ -438,26 +541,31 @@ async def list_blocked(call: types.CallbackQuery):
     if not is_admin(user_id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    blocked = get_blocked_users()
+    direction, cursor = (callback_data.direction, callback_data.cursor) if callback_data else ("n", 0)
+    blocked, has_more = await db.get_blocked_page(cursor, direction == "p", PAGE_SIZE)
+    if not blocked and cursor:
+        # Страница опустела, пока админ листал — возвращаемся к началу
+        direction, cursor = "n", 0
+        blocked, has_more = await db.get_blocked_page(cursor, False, PAGE_SIZE)
     if not blocked:
         text = "<b>📋 Список заблокированных пуст</b>"
     else:
         text = "<b>📋 Заблокированные пользователи:</b>\n"
         for user_id, ban_until in blocked:
-            ban_until_dt = datetime.fromisoformat(ban_until)
-            remaining = ban_until_dt - datetime.now()
-            remaining_text = f"до {ban_until_dt.strftime('%Y-%m-%d %H:%M')}" if remaining.total_seconds() > 0 else "навсегда"
+            remaining_text = f"до {datetime.fromisoformat(ban_until).strftime('%Y-%m-%d %H:%M')}" if ban_until else "навсегда"
             text += f"• {user_id} - {remaining_text}\n"
     builder = InlineKeyboardBuilder()
     for user_id, _ in blocked:
-        builder.button(text=f"👤 {user_id}", callback_data=f"manage_{user_id}")
-    builder.button(text="🔙 Назад", callback_data="admin_panel")
+        builder.button(text=f"👤 {user_id}", callback_data=cb.ManageBlocked(user_id=user_id).pack())
     builder.adjust(1)
+    add_page_buttons(builder, cb.BlockedPage, [row[0] for row in blocked], direction, cursor, has_more)
+    builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel"))
     await call.message.edit_text(text, reply_markup=builder.as_markup())
     await call.answer()
 
-@dp.callback_query(lambda c: c.data == "list_reports")
-async def list_reports(call: types.CallbackQuery):
+@callback_router.register("list_reports")
+@callback_router.register(cb.ReportsPage)
+async def list_reports(call: types.CallbackQuery, callback_data: cb.ReportsPage = None):
     user_id = call.from_user.id
     if is_user_blocked(user_id):
         await call.message.edit_text("<b>🚫 Вы заблокированы</b> и не можете использовать бота!")
@@ -466,24 +574,33 @@ async def list_reports(call: types.CallbackQuery):
     if not is_admin(user_id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    reports = get_reported_messages()
+    direction, cursor = (callback_data.direction, callback_data.cursor) if callback_data else ("n", 0)
+    reports, has_more = await db.get_reported_page(cursor, direction == "p", PAGE_SIZE)
+    if not reports and cursor:
+        direction, cursor = "n", 0
+        reports, has_more = await db.get_reported_page(cursor, False, PAGE_SIZE)
     if not reports:
         text = "<b>📩 Список жалоб пуст</b>"
     else:
         text = "<b>📩 Жалобы:</b>\n"
-        for msg_id, owner_id, sender_id, message in reports:
-            truncated_message = message[:50] + "..." if len(message) > 50 else message
-            text += f"ID: {msg_id} | Отправитель: {sender_id} | Владелец: {owner_id}\nСообщение: {truncated_message}\n"
+        for msg_id, owner_id, sender_id, message, content_type, copies in reports:
+            if message and len(message) > 50:
+                message = message[:50] + "..."
+            truncated_message = describe_message(content_type, message)
+            copies_text = f" | Копий: {copies}" if copies > 1 else ""
+            text += (f"ID: {msg_id} | Отправитель: {sender_id} | Владелец: {owner_id}{copies_text}\n"
+                     f"Сообщение: {truncated_message}\n")
     builder = InlineKeyboardBuilder()
-    for msg_id, _, sender_id, _ in reports:
-        builder.button(text=f"📩 {msg_id}", callback_data=f"manage_report_{sender_id}_{msg_id}")
-    builder.button(text="🔙 Назад", callback_data="admin_panel")
+    for msg_id, _, sender_id, _, _, _ in reports:
+        builder.button(text=f"📩 {msg_id}", callback_data=cb.ManageReport(sender_id=sender_id, msg_id=msg_id).pack())
     builder.adjust(1)
+    add_page_buttons(builder, cb.ReportsPage, [row[0] for row in reports], direction, cursor, has_more)
+    builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel"))
     await call.message.edit_text(text, reply_markup=builder.as_markup())
     await call.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("manage_report_"))
-async def manage_report(call: types.CallbackQuery):
+@callback_router.register(cb.ManageReport)
+async def manage_report(call: types.CallbackQuery, callback_data: cb.ManageReport):
     user_id = call.from_user.id
     if is_user_blocked(user_id):
         await call.message.edit_text("<b>🚫 Вы заблокированы</b> и не можете использовать бота!")
@@ -492,27 +609,23 @@ async def manage_report(call: types.CallbackQuery):
     if not is_admin(user_id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    parts = call.data.split("_")
-    sender_id, msg_id = int(parts[2]), int(parts[3])
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("SELECT link_owner_id, message FROM messages WHERE id=?", (msg_id,))
-        result = c.fetchone()
+    sender_id, msg_id = callback_data.sender_id, callback_data.msg_id
+    result = await db.get_message(msg_id)
     if result:
-        owner_id, message = result
+        owner_id, _, message, content_type = result
         text = (
             f"<b>📩 Жалоба ID: {msg_id}</b>\n"
             f"Владелец ссылки: {owner_id}\n"
             f"Отправитель: {sender_id}\n"
-            f"Сообщение: {message}"
+            f"Сообщение: {describe_message(content_type, message)}"
         )
     else:
         text = f"<b>📩 Жалоба ID: {msg_id} не найдена</b>"
-    await call.message.edit_text(text, reply_markup=get_ban_duration_panel(sender_id, msg_id))
+    await call.message.edit_text(text, reply_markup=get_ban_duration_panel(sender_id, msg_id, with_history=True))
     await call.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("manage_") and c.data.split("_")[1].isdigit())
-async def manage_blocked(call: types.CallbackQuery):
+@callback_router.register(cb.ManageBlocked)
+async def manage_blocked(call: types.CallbackQuery, callback_data: cb.ManageBlocked):
     user_id = call.from_user.id
     if is_user_blocked(user_id):
         await call.message.edit_text("<b>🚫 Вы заблокированы</b> и не можете использовать бота!")
@@ -521,57 +634,48 @@ async def manage_blocked(call: types.CallbackQuery):
     if not is_admin(user_id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    blocked_user_id = int(call.data.split("_")[1])
-    with sqlite3.connect('bot.db') as conn:
-        c = conn.cursor()
-        c.execute("SELECT ban_until FROM blocked_users WHERE user_id=?", (blocked_user_id,))
-        result = c.fetchone()
-    if result:
-        ban_until = datetime.fromisoformat(result[0])
-        remaining = ban_until - datetime.now()
-        remaining_text = f"до {ban_until.strftime('%Y-%m-%d %H:%M')}" if remaining.total_seconds() > 0 else "навсегда"
+    blocked_user_id = callback_data.user_id
+    ban_until = bans.get(blocked_user_id)
+    if ban_until is not None:
+        remaining_text = f"до {datetime.fromtimestamp(ban_until).strftime('%Y-%m-%d %H:%M')}" if ban_until != PERMANENT else "навсегда"
         text = f"<b>👤 Пользователь {blocked_user_id}</b>\nСрок бана: {remaining_text}"
     else:
         text = f"<b>👤 Пользователь {blocked_user_id}</b> не найден в списке заблокированных"
     await call.message.edit_text(text, reply_markup=get_blocked_user_panel(blocked_user_id))
     await call.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("edit_ban_") and len(c.data.split("_")) == 3)
-async def edit_ban(call: types.CallbackQuery, state: FSMContext):
+@callback_router.register(cb.EditBan)
+async def edit_ban(call: types.CallbackQuery, callback_data: cb.EditBan):
     if not is_admin(call.from_user.id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    user_id = int(call.data.split("_")[2])
+    user_id = callback_data.user_id
     text = f"Выберите новый срок бана для <b>{user_id}</b>:"
     await call.message.edit_text(text, reply_markup=get_edit_ban_duration_panel(user_id))
     await call.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("edit_ban_duration_") and len(c.data.split("_")) == 5)
-async def handle_edit_ban_duration(call: types.CallbackQuery):
+@callback_router.register(cb.EditBanDuration)
+async def handle_edit_ban_duration(call: types.CallbackQuery, callback_data: cb.EditBanDuration):
     if not is_admin(call.from_user.id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    parts = call.data.split("_")
-    user_id, duration = int(parts[3]), int(parts[4])
-
-    
+    user_id, duration = callback_data.user_id, callback_data.hours
 
-    duration_hours = duration if duration > 0 else 999999
-    ban_until = datetime.now() + timedelta(hours=duration_hours)
+    ban_until = datetime.now() + timedelta(hours=duration)
     
     if duration > 0:
         duration_text = f"{duration} час(ов), до {ban_until.strftime('%Y-%m-%d %H:%M')}"
     else:
         duration_text = "навсегда"
     
-    block_user(user_id, duration_hours)
+    await block_user(user_id, duration)
     text = f"<b>🚫 Срок бана для {user_id}</b> изменён на {duration_text}"
     await call.message.edit_text(text, reply_markup=get_blocked_user_panel(user_id))
     await call.answer(f"✅ Срок бана изменён на {duration_text}")
     
     try:
-        await bot.send_message(user_id, f"<b>🚫 Ваш срок бана изменён</b> на {duration_text}")
-    except TelegramBadRequest as e:
+        await delivery.send_message(user_id, f"<b>🚫 Ваш срок бана изменён</b> на {duration_text}")
+    except TelegramAPIError as e:
         logger.warning(f"Не удалось уведомить пользователя {user_id} о новом сроке бана: {e}")
 
 @dp.message(UserState.waiting_for_ban_duration)  # Можно удалить, если не нужен текстовый ввод
@@ -586,8 +690,7 @@ async def process_ban_duration(message: types.Message, state: FSMContext):
             raise ValueError("Срок не может быть отрицательным")
         data = await state.get_data()
         user_id = data.get("user_id")
-        duration_hours = duration if duration > 0 else 999999
-        block_user(user_id, duration_hours)
+        await block_user(user_id, duration)
         duration_text = f"{duration} час(ов)" if duration > 0 else "навсегда"
         text = f"<b>🚫 Срок бана для {user_id}</b> изменён на {duration_text}"
         await message.answer(text, reply_markup=get_main_menu(True))
@@ -595,18 +698,18 @@ async def process_ban_duration(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Ошибка: введите корректное число часов (0 или больше)!")
 
-@dp.callback_query(lambda c: c.data.startswith("unblock_"))
-async def unblock(call: types.CallbackQuery):
+@callback_router.register(cb.Unblock)
+async def unblock(call: types.CallbackQuery, callback_data: cb.Unblock):
     if not is_admin(call.from_user.id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    user_id = int(call.data.split("_")[1])
-    unblock_user(user_id)
+    user_id = callback_data.user_id
+    await unblock_user(user_id)
     text = f"<b>✅ Пользователь {user_id} разблокирован</b>"
     await call.message.edit_text(text)
     await call.answer(f"✅ Пользователь {user_id} разблокирован")
 
-@dp.callback_query(lambda c: c.data == "manage_admins")
+@callback_router.register("manage_admins")
 async def manage_admins(call: types.CallbackQuery):
     user_id = call.from_user.id
     if is_user_blocked(user_id):
@@ -624,12 +727,12 @@ async def manage_admins(call: types.CallbackQuery):
     await call.message.edit_text(text, reply_markup=get_admin_list_keyboard())
     await call.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("remove_admin_"))
-async def remove_admin_handler(call: types.CallbackQuery):
+@callback_router.register(cb.RemoveAdmin)
+async def remove_admin_handler(call: types.CallbackQuery, callback_data: cb.RemoveAdmin):
     if not is_admin(call.from_user.id):
         await call.answer("❌ У вас нет прав!", show_alert=True)
         return
-    admin_id = int(call.data.split("_")[2])
+    admin_id = callback_data.admin_id
     admins = get_admins()
     if len(admins) <= 1:
         await call.answer("Нельзя удалить последнего администратора!", show_alert=True)
@@ -640,23 +743,34 @@ async def remove_admin_handler(call: types.CallbackQuery):
     if admin_id not in admins:
         await call.answer(f"Пользователь {admin_id} не является администратором!", show_alert=True)
         return
-    remove_admin(admin_id)
+    await remove_admin(admin_id)
     text = f"<b>👥 Администратор {admin_id} удалён</b>"
     await call.message.edit_text(text, reply_markup=get_admin_list_keyboard())
     await call.answer(f"Администратор {admin_id} удалён")
 
-@dp.callback_query(lambda c: c.data == "back_to_menu")
+@callback_router.register("back_to_menu")
 async def back_to_menu(call: types.CallbackQuery):
     user_id = call.from_user.id
     if is_user_blocked(user_id):
         await call.message.edit_text("<b>🚫 Вы заблокированы</b> и не можете использовать бота!")
         return
-    unique_link = get_or_create_user_link(user_id)
+    unique_link = await get_or_create_user_link(user_id)
     link = f"https://t.me/{bot_username}?start={unique_link}"
     text = f"📎 Ваша ссылка:\n<a href='{link}'>{link}</a>"
     await call.message.edit_text(text, reply_markup=get_main_menu(is_admin(user_id)), disable_web_page_preview=True)
     await call.answer()
 
+def add_page_buttons(builder, page, keys, direction, cursor, has_more):
+    # page — класс данных кнопки страницы: direction "n" — после cursor, "p" — перед ним
+    has_prev, has_next = (has_more, True) if direction == "p" else (cursor > 0, has_more)
+    nav = []
+    if has_prev and keys:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=page(direction="p", cursor=keys[0]).pack()))
+    if has_next and keys:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=page(direction="n", cursor=keys[-1]).pack()))
+    if nav:
+        builder.row(*nav)
+
 def get_cancel_button():
     builder = InlineKeyboardBuilder()
     builder.button(text="❌ Отмена", callback_data="cancel_input")
@@ -680,11 +794,11 @@ async def add_admin_command(message: types.Message, state: FSMContext):
         except ValueError:
             await message.answer("<b>Ошибка:</b> ID должен быть числом!")
 
-@dp.callback_query(lambda c: c.data == "cancel_input")
+@callback_router.register("cancel_input")
 async def cancel_input(call: types.CallbackQuery, state: FSMContext):
     await state.clear()
     user_id = call.from_user.id
-    unique_link = get_or_create_user_link(user_id)
+    unique_link = await get_or_create_user_link(user_id)
     link = f"https://t.me/{bot_username}?start={unique_link}"
     text =f"Ваша ссылка: <a href='{link}'>{link}</a>"
     await call.message.edit_text(text, reply_markup=get_main_menu(is_admin(user_id)), disable_web_page_preview=True)
@@ -707,21 +821,267 @@ async def process_add_admin_direct(message: types.Message, new_admin_id: int):
     if is_admin(new_admin_id):
         await message.answer("<b>⚠️ Этот пользователь уже администратор!</b>", reply_markup=get_main_menu(True))
     else:
-        add_admin(new_admin_id)
+        await add_admin(new_admin_id)
         await message.answer(f"<b>✅ Пользователь {new_admin_id}</b> добавлен как администратор!", reply_markup=get_main_menu(True))
         try:
-            await bot.send_message(new_admin_id, "<b>👨‍💼 Вы назначены администратором бота!</b>")
-        except TelegramBadRequest as e:
+            await delivery.send_message(new_admin_id, "<b>👨‍💼 Вы назначены администратором бота!</b>")
+        except TelegramAPIError as e:
             logger.warning(f"Не удалось уведомить нового админа {new_admin_id}: {e}")
 
+@dp.message(Command("broadcast"))
+async def broadcast_command(message: types.Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer("Команда не найдена.")
+        return
+    await message.answer("Отправьте сообщение для рассылки (текст, фото, видео…). "
+                         "Не удаляйте его до окончания рассылки.", reply_markup=get_cancel_button())
+    await state.set_state(UserState.waiting_for_broadcast)
+
+@dp.message(UserState.waiting_for_broadcast)
+async def process_broadcast(message: types.Message, state: FSMContext):
+    await state.clear()
+    if not is_admin(message.from_user.id):
+        await message.answer("Команда не найдена.")
+        return
+    broadcast_id = await broadcaster.start(message.chat.id, message.chat.id, message.message_id)
+    logger.info(f"Админ {message.from_user.id} запустил рассылку #{broadcast_id}")
+
+@callback_router.register(cb.StopBroadcast)
+async def stop_broadcast(call: types.CallbackQuery, callback_data: cb.StopBroadcast):
+    if not is_admin(call.from_user.id):
+        await call.answer("❌ У вас нет прав!", show_alert=True)
+        return
+    if await broadcaster.stop(callback_data.broadcast_id):
+        await call.answer("⏹ Рассылка останавливается")
+    else:
+        await call.answer("Рассылка уже завершена")
+
+# Поиск по жалобам
+def get_search_keyboard(rows, page, offset, has_more):
+    # rows — (id, отправитель, в архиве); архивные жалобы только показываются.
+    # page(offset) — данные кнопки соседней страницы
+    builder = InlineKeyboardBuilder()
+    for msg_id, sender_id, archived in rows:
+        if not archived:
+            builder.button(text=f"📩 {msg_id}", callback_data=cb.ManageReport(sender_id=sender_id, msg_id=msg_id).pack())
+    builder.adjust(1)
+    nav = []
+    if offset > 0:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=page(max(0, offset - PAGE_SIZE)).pack()))
+    if has_more:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=page(offset + PAGE_SIZE).pack()))
+    if nav:
+        builder.row(*nav)
+    builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel"))
+    return builder.as_markup()
+
+async def render_search(query, offset):
+    terms = parse_query(query)
+    rows, has_more = await db.search_reports(build_query(terms), offset, PAGE_SIZE) if terms else ([], False)
+    if not rows:
+        text = f"<b>🔎 По запросу «{escape(query)}» ничего не найдено</b>"
+    else:
+        text = f"<b>🔎 Жалобы по запросу «{escape(query)}»:</b>\n"
+        for msg_id, sender_id, owner_id, message, content_type, archived in rows:
+            fragment = highlight(message, terms)
+            if content_type not in (None, "text"):
+                fragment = f"[{content_type}] {fragment}"
+            archived_text = " | В архиве" if archived else ""
+            text += (f"ID: {msg_id} | Отправитель: {sender_id} | Владелец: {owner_id}{archived_text}\n"
+                     f"Сообщение: {fragment}\n")
+    markup = get_search_keyboard([(row[0], row[1], row[5]) for row in rows],
+                                 lambda page_offset: cb.SearchPage(offset=page_offset), offset, has_more)
+    return text, markup
+
+async def render_sender_reports(sender_id, offset):
+    rows, has_more = await db.get_sender_reports(sender_id, offset, PAGE_SIZE)
+    if not rows:
+        text = f"<b>🔎 Жалоб на отправителя {sender_id} нет</b>"
+    else:
+        text = f"<b>🔎 Жалобы на отправителя {sender_id}:</b>\n"
+        for msg_id, owner_id, message, content_type, archived in rows:
+            if message and len(message) > 50:
+                message = message[:50] + "..."
+            archived_text = " | В архиве" if archived else ""
+            text += (f"ID: {msg_id} | Владелец: {owner_id}{archived_text}\n"
+                     f"Сообщение: {describe_message(content_type, message)}\n")
+    markup = get_search_keyboard([(row[0], sender_id, row[4]) for row in rows],
+                                 lambda page_offset: cb.SenderReports(sender_id=sender_id, offset=page_offset),
+                                 offset, has_more)
+    return text, markup
+
+@dp.message(Command("search"))
+async def search_command(message: types.Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer("Команда не найдена.")
+        return
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        await message.answer("<code>/search текст</code> — поиск по жалобам\n"
+                             "<code>/search ID</code> — жалобы на отправителя")
+        return
+    if query.isdigit():
+        text, markup = await render_sender_reports(int(query), 0)
+    else:
+        # Запрос нужен для перелистывания страниц
+        await state.update_data(search_query=query)
+        text, markup = await render_search(query, 0)
+    await message.answer(text, reply_markup=markup)
+
+@callback_router.register(cb.SearchPage)
+async def search_page(call: types.CallbackQuery, callback_data: cb.SearchPage, state: FSMContext):
+    if not is_admin(call.from_user.id):
+        await call.answer("❌ У вас нет прав!", show_alert=True)
+        return
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await call.answer("Поиск устарел, повторите /search", show_alert=True)
+        return
+    text, markup = await render_search(query, callback_data.offset)
+    await call.message.edit_text(text, reply_markup=markup)
+    await call.answer()
+
+@callback_router.register(cb.SenderReports)
+async def sender_reports(call: types.CallbackQuery, callback_data: cb.SenderReports):
+    if not is_admin(call.from_user.id):
+        await call.answer("❌ У вас нет прав!", show_alert=True)
+        return
+    text, markup = await render_sender_reports(callback_data.sender_id, callback_data.offset)
+    await call.message.edit_text(text, reply_markup=markup)
+    await call.answer()
+
+@dp.callback_query()
+async def route_callback(call: types.CallbackQuery, state: FSMContext):
+    await callback_router.dispatch(call, state=state)
+
+@dp.shutdown()
+async def drain_updates():
+    # Принятые апдейты дообрабатываются после остановки приёма. Хранилище FSM к этому моменту
+    # уже закрыто (его обработчик остановки зарегистрирован раньше), поэтому сбрасываем его повторно
+    await executor.close()
+    await storage.flush()
+    # Доставка сообщений, принятых до остановки
+    if background_tasks:
+        await asyncio.wait(background_tasks, timeout=STOP_TIMEOUT)
+
+def is_ready():
+    return db.connected and bot_username is not None
+
 # Основная функция
 async def main():
     global bot_username
-    init_db()
-    bot_info = await bot.get_me()
-    bot_username = bot_info.username
-    logger.info(f"Бот {bot_username} запущен!")
-    await dp.start_polling(bot)
+    if WORKERS > 1:
+        await run_ingress()
+        return
+    await init_db()
+    delivery.start()
+    executor.start()
+    storage.start()
+    stats.start()
+    await broadcaster.resume()
+    expiry_task = asyncio.create_task(bans.run_expiry(expire_bans))
+    retention_task = asyncio.create_task(retention.run_retention(db, stats))
+    metrics_runner = await metrics.start_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    webhook_runner = None
+    try:
+        bot_info = await bot.get_me()
+        bot_username = bot_info.username
+        logger.info(f"Бот {bot_username} запущен!")
+        if WEBHOOK_URL:
+            webhook_runner = await webhook.start_server(dp, bot, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT,
+                                                        WEBHOOK_SECRET, is_ready)
+            await asyncio.Event().wait()  # до остановки процесса
+        else:
+            # getUpdates не работает, пока у бота установлен вебхук
+            await bot.delete_webhook()
+            # Апдейт только ставится в очередь UpdateExecutor, поэтому задача на апдейт не нужна
+            await dp.start_polling(bot, handle_as_tasks=False)
+    finally:
+        if webhook_runner is not None:
+            await webhook_runner.cleanup()
+        expiry_task.cancel()
+        retention_task.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await broadcaster.close()
+        await delivery.close()
+        await stats.close()
+        await db.close()
+
+# Режим нескольких процессов
+async def run_ingress():
+    # Миграции и ключ ссылок создаются до запуска воркеров, чтобы не идти параллельно
+    await init_db()
+    await db.close()
+    ingress = Ingress(worker_process, WORKERS)
+    ingress.start()
+    supervisor = asyncio.create_task(ingress.supervise())
+    metrics_runner = await metrics.start_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    webhook_runner = None
+    allowed_updates = dp.resolve_used_update_types()
+    try:
+        if WEBHOOK_URL:
+            webhook_runner = await ingress.start_webhook(bot, allowed_updates, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST,
+                                                         WEBHOOK_PORT, WEBHOOK_SECRET)
+            await asyncio.Event().wait()  # до остановки процесса
+        else:
+            await bot.delete_webhook()
+            await ingress.poll(bot, allowed_updates)
+    finally:
+        supervisor.cancel()
+        if webhook_runner is not None:
+            await webhook_runner.cleanup()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await ingress.stop()
+        await bot.session.close()
+
+async def run_worker(index, workers, updates, ready):
+    global bot_username
+    await init_db()
+    delivery.set_rate(GLOBAL_RATE / workers)
+    delivery.start()
+    executor.start()
+    storage.start()
+    stats.start()
+    tasks = [asyncio.create_task(sync_shared_state())]
+    # Фоновые задачи, которые должны идти в одном экземпляре, — только в воркере 0.
+    # Рассылки тоже: /broadcast в другом воркере только создаёт запись, воркер 0 её подхватывает
+    broadcaster.owner = index == 0
+    if index == 0:
+        tasks.append(asyncio.create_task(broadcaster.watch()))
+        tasks.append(asyncio.create_task(bans.run_expiry(expire_bans)))
+        tasks.append(asyncio.create_task(retention.run_retention(db, stats)))
+    metrics_runner = await metrics.start_server(METRICS_HOST, METRICS_PORT + 1 + index) if METRICS_PORT else None
+    try:
+        bot_username = (await bot.get_me()).username
+        logger.info(f"Воркер {index} бота {bot_username} запущен")
+        await dp.emit_startup(bot=bot)
+        ready.set()
+        await consume(updates, lambda update: dp.feed_raw_update(bot, update))
+    finally:
+        for task in tasks:
+            task.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await dp.emit_shutdown(bot=bot)  # в том числе сброс кэша FSM в БД
+        await broadcaster.close()
+        await delivery.close()
+        await stats.close()
+        await db.close()
+        await bot.session.close()
+
+def worker_process(index, workers, updates, ready):
+    # Точка входа процесса-воркера (multiprocessing, spawn)
+    try:
+        asyncio.run(run_worker(index, workers, updates, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_logger()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    finally:
+        shutdown_logger()  # дописать логи из очереди
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+from aiogram.methods import EditMessageText
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+import callbacks as cb
+import metrics
+from delivery import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_SHARE = 2 / 3     # доля лимита отправки процесса: остальное — запас для обычного трафика
+BROADCAST_CONCURRENCY = 20  # сколько сообщений рассылки одновременно стоит в очереди доставки
+BATCH_SIZE = 100            # получателей между контрольными точками
+PROGRESS_INTERVAL = 3       # как часто обновлять сообщение с прогрессом, сек
+WATCH_INTERVAL = 1          # как часто воркер-исполнитель ищет рассылки, созданные другими воркерами, сек
+
+
+class _Broadcast:
+    __slots__ = ("id", "admin_chat_id", "progress_message_id", "from_chat_id", "message_id", "last_user_id",
+                 "total", "sent", "failed", "blocked")
+
+    def __init__(self, row):
+        (self.id, self.admin_chat_id, self.progress_message_id, self.from_chat_id, self.message_id,
+         self.last_user_id, self.total, self.sent, self.failed, self.blocked) = row
+
+
+class Broadcaster:
+    # Рассылка копии сообщения админа всем пользователям из users. Получатели читаются
+    # пачками по user_id, после каждой пачки позиция сохраняется в broadcasts —
+    # после перезапуска рассылка продолжается с неё. В режиме нескольких процессов рассылки
+    # выполняет только воркер 0: остальные лишь создают запись, он подхватывает её в watch
+    def __init__(self, db, delivery, rate=None, concurrency=BROADCAST_CONCURRENCY):
+        self.db = db
+        self.delivery = delivery
+        self.rate = rate  # сообщений в секунду; None — BROADCAST_SHARE от лимита очереди доставки
+        self.concurrency = concurrency
+        self.owner = True  # рассылки выполняются в этом процессе
+        self._tasks = {}
+        self._stopping = set()
+
+    async def start(self, admin_chat_id, from_chat_id, message_id):
+        progress = await self.delivery.send_message(admin_chat_id, "<b>📣 Рассылка запускается…</b>")
+        row = await self.db.create_broadcast(admin_chat_id, progress.message_id, from_chat_id, message_id)
+        if self.owner:
+            self._spawn(_Broadcast(row))
+        return row[0]
+
+    async def resume(self):
+        # Запускает рассылки в статусе running, которые ещё не идут в этом процессе
+        for row in await self.db.get_running_broadcasts():
+            if row[0] in self._tasks:
+                continue
+            logger.info(f"Продолжение рассылки #{row[0]} после user_id {row[5]}")
+            self._spawn(_Broadcast(row))
+
+    async def watch(self, interval=WATCH_INTERVAL):
+        # Воркер-исполнитель: продолжает прерванные рассылки и берёт новые из других воркеров
+        while True:
+            try:
+                await self.resume()
+            except Exception as e:
+                logger.error(f"Ошибка при поиске рассылок: {e}")
+            await asyncio.sleep(interval)
+
+    async def stop(self, broadcast_id):
+        task = self._tasks.get(broadcast_id)
+        if task is None:
+            # Рассылка может идти в другом процессе-воркере: он увидит статус на контрольной точке
+            return await self.db.cancel_broadcast(broadcast_id)
+        self._stopping.add(broadcast_id)
+        task.cancel()
+        return True
+
+    async def close(self):
+        # При остановке бота рассылка остаётся в статусе running и продолжится после запуска
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, broadcast):
+        task = asyncio.create_task(self._run(broadcast))
+        self._tasks[broadcast.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast.id, None))
+
+    async def _send(self, broadcast, user_id, bucket, semaphore):
+        async with semaphore:
+            while delay := bucket.delay(time.monotonic()):
+                await asyncio.sleep(delay)
+            bucket.consume(time.monotonic())
+            try:
+                await self.delivery.copy_message(user_id, broadcast.from_chat_id, broadcast.message_id)
+                result = "sent"
+            except TelegramForbiddenError:
+                result = "blocked"  # бот заблокирован или аккаунт удалён
+            except TelegramBadRequest as e:
+                result = "blocked" if "chat not found" in str(e).lower() else "failed"
+            except Exception as e:
+                logger.warning(f"Рассылка #{broadcast.id}: не удалось отправить {user_id}: {e}")
+                result = "failed"
+        metrics.broadcast_messages.inc(result)
+        return result
+
+    async def _run(self, broadcast):
+        # Лимит очереди делится между воркерами, поэтому доля считается от него, а не от общего лимита бота
+        bucket = TokenBucket(self.rate or self.delivery.rate * BROADCAST_SHARE)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        shown = 0.0
+        try:
+            while True:
+                user_ids = await self.db.get_broadcast_recipients(broadcast.last_user_id, BATCH_SIZE)
+                if not user_ids:
+                    break
+                results = await asyncio.gather(*(self._send(broadcast, user_id, bucket, semaphore)
+                                                 for user_id in user_ids))
+                broadcast.sent += results.count("sent")
+                broadcast.failed += results.count("failed")
+                broadcast.blocked += results.count("blocked")
+                broadcast.last_user_id = user_ids[-1]
+                # Заблокировавшие бота исключаются из следующих рассылок
+                inactive = [user_id for user_id, result in zip(user_ids, results) if result == "blocked"]
+                status = await self.db.save_broadcast_progress(broadcast.id, broadcast.last_user_id, broadcast.sent,
+                                                               broadcast.failed, broadcast.blocked, inactive)
+                if status == "cancelled":
+                    await self._show(broadcast, "⏹ Рассылка остановлена")
+                    return
+                if time.monotonic() - shown >= PROGRESS_INTERVAL:
+                    shown = time.monotonic()
+                    await self._show(broadcast, "📣 Рассылка идёт", running=True)
+        except asyncio.CancelledError:
+            if broadcast.id in self._stopping:
+                self._stopping.discard(broadcast.id)
+                await self.db.finish_broadcast(broadcast.id, "cancelled")
+                await self._show(broadcast, "⏹ Рассылка остановлена")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка рассылки #{broadcast.id}: {e}")
+            await self.db.finish_broadcast(broadcast.id, "failed")
+            await self._show(broadcast, "❌ Рассылка прервана ошибкой")
+            return
+        await self.db.finish_broadcast(broadcast.id, "done")
+        await self._show(broadcast, "✅ Рассылка завершена")
+        logger.info(f"Рассылка #{broadcast.id} завершена: отправлено {broadcast.sent}, "
+                    f"ошибок {broadcast.failed}, заблокировали бота {broadcast.blocked}")
+
+    async def _show(self, broadcast, title, running=False):
+        done = broadcast.sent + broadcast.failed + broadcast.blocked
+        text = (
+            f"<b>{title} #{broadcast.id}</b>\n"
+            f"Обработано: {done} из {broadcast.total}\n"
+            f"Отправлено: {broadcast.sent}\n"
+            f"Ошибок: {broadcast.failed}\n"
+            f"Заблокировали бота: {broadcast.blocked}"
+        )
+        markup = None
+        if running:
+            builder = InlineKeyboardBuilder()
+            builder.button(text="⏹ Остановить", callback_data=cb.StopBroadcast(broadcast_id=broadcast.id).pack())
+            markup = builder.as_markup()
+        # Прогресс — по возможности: через очередь доставки (повторы при флуд-лимите и сетевых ошибках),
+        # а ошибка обновления ("message is not modified", бот заблокирован) не прерывает рассылку
+        try:
+            await self.delivery.submit(broadcast.admin_chat_id, EditMessageText(
+                chat_id=broadcast.admin_chat_id, message_id=broadcast.progress_message_id, text=text,
+                reply_markup=markup))
+        except TelegramAPIError as e:
+            logger.debug(f"Не удалось обновить прогресс рассылки #{broadcast.id}: {e}")
@@ -0,0 +1,189 @@
+import inspect
+import logging
+import re
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ":"
+MAX_LENGTH = 64  # ограничение Telegram на callback_data, байт
+
+
+class CallbackData:
+    # Данные inline-кнопки: короткий префикс + типизированные поля ("rp:42").
+    # Облегчённая замена aiogram CallbackData: разбор — split и приведение типов, без pydantic.
+    # Кнопки без параметров используют просто имя ("admin_panel")
+    def __init_subclass__(cls, prefix, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.__prefix__ = prefix
+        cls.__fields = tuple(cls.__annotations__.items())
+
+    def __init__(self, **values):
+        for name, type_ in self.__fields:
+            setattr(self, name, type_(values[name]))
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name, _ in self.__fields)
+        return f"{type(self).__name__}({values})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.pack() == other.pack()
+
+    def pack(self):
+        value = SEPARATOR.join([self.__prefix__, *(str(getattr(self, name)) for name, _ in self.__fields)])
+        if len(value.encode()) > MAX_LENGTH:
+            raise ValueError(f"callback_data длиннее {MAX_LENGTH} байт: {value!r}")
+        return value
+
+    @classmethod
+    def unpack(cls, value):
+        prefix, *parts = value.split(SEPARATOR)
+        if prefix != cls.__prefix__ or len(parts) != len(cls.__fields):
+            raise ValueError(f"Неверные данные кнопки для {cls.__name__}: {value!r}")
+        obj = cls.__new__(cls)
+        for (name, type_), part in zip(cls.__fields, parts):
+            setattr(obj, name, type_(part))
+        return obj
+
+
+class Report(CallbackData, prefix="rp"):
+    msg_id: int
+
+
+class Ban(CallbackData, prefix="bn"):
+    user_id: int
+    msg_id: int
+    hours: int
+
+
+class Ignore(CallbackData, prefix="ig"):
+    msg_id: int
+
+
+class ManageReport(CallbackData, prefix="mr"):
+    sender_id: int
+    msg_id: int
+
+
+class ManageBlocked(CallbackData, prefix="mb"):
+    user_id: int
+
+
+class EditBan(CallbackData, prefix="eb"):
+    user_id: int
+
+
+class EditBanDuration(CallbackData, prefix="ed"):
+    user_id: int
+    hours: int
+
+
+class Unblock(CallbackData, prefix="ub"):
+    user_id: int
+
+
+class RemoveAdmin(CallbackData, prefix="ra"):
+    admin_id: int
+
+
+class StopBroadcast(CallbackData, prefix="sb"):
+    broadcast_id: int
+
+
+class BlockedPage(CallbackData, prefix="bp"):
+    direction: str
+    cursor: int
+
+
+class ReportsPage(CallbackData, prefix="pp"):
+    direction: str
+    cursor: int
+
+
+class SearchPage(CallbackData, prefix="sp"):
+    offset: int  # сам запрос хранится в данных FSM: в 64 байта он может не поместиться
+
+
+class SenderReports(CallbackData, prefix="sr"):
+    sender_id: int
+    offset: int
+
+
+# Старый формат кнопок ("report_42", "ban_1_2_24", ...) остаётся под уже отправленными
+# сообщениями, поэтому переводим его в новый. Порядок важен: более длинные префиксы раньше
+_LEGACY = [
+    (re.compile(r"report_(\d+)"), lambda m: Report(msg_id=m[1])),
+    (re.compile(r"ban_(\d+)_(\d+)_(\d+)"), lambda m: Ban(user_id=m[1], msg_id=m[2], hours=m[3])),
+    (re.compile(r"ignore_(\d+)"), lambda m: Ignore(msg_id=m[1])),
+    (re.compile(r"manage_report_(\d+)_(\d+)"), lambda m: ManageReport(sender_id=m[1], msg_id=m[2])),
+    (re.compile(r"manage_(\d+)"), lambda m: ManageBlocked(user_id=m[1])),
+    (re.compile(r"edit_ban_duration_(\d+)_(\d+)"), lambda m: EditBanDuration(user_id=m[1], hours=m[2])),
+    (re.compile(r"edit_ban_(\d+)"), lambda m: EditBan(user_id=m[1])),
+    (re.compile(r"unblock_(\d+)"), lambda m: Unblock(user_id=m[1])),
+    (re.compile(r"remove_admin_(\d+)"), lambda m: RemoveAdmin(admin_id=m[1])),
+    (re.compile(r"blocked_page_([np])_(\d+)"), lambda m: BlockedPage(direction=m[1], cursor=m[2])),
+    (re.compile(r"reports_page_([np])_(\d+)"), lambda m: ReportsPage(direction=m[1], cursor=m[2])),
+]
+
+
+def parse_legacy(data):
+    for pattern, build in _LEGACY:
+        match = pattern.fullmatch(data)
+        if match:
+            return build(match)
+    return None
+
+
+class CallbackRouter:
+    # Выбор обработчика по префиксу одним поиском в словаре вместо перебора фильтров
+    def __init__(self):
+        self._routes = {}
+
+    def register(self, key):
+        # key — класс CallbackData или строка для кнопки без параметров
+        prefix = key.__prefix__ if isinstance(key, type) else key
+
+        def decorator(func):
+            if prefix in self._routes:
+                raise ValueError(f"Префикс {prefix!r} уже зарегистрирован")
+            accepts = set(inspect.signature(func).parameters)
+            self._routes[prefix] = (key if isinstance(key, type) else None, func, accepts)
+            return func
+        return decorator
+
+    def resolve(self, data):
+        # Возвращает (обработчик, разобранные данные, принимаемые аргументы) или None
+        prefix, sep, _ = data.partition(SEPARATOR)
+        route = self._routes.get(prefix)
+        if route is not None:
+            cls, func, accepts = route
+            if cls is None:
+                return (func, None, accepts) if not sep else None
+            try:
+                return func, cls.unpack(data), accepts
+            except (TypeError, ValueError):
+                return None
+        legacy = parse_legacy(data)
+        if legacy is None:
+            return None
+        cls, func, accepts = self._routes[legacy.__prefix__]
+        return func, legacy, accepts
+
+    async def dispatch(self, call, **kwargs):
+        resolved = self.resolve(call.data or "")
+        if resolved is None:
+            logger.warning(f"Неизвестные данные кнопки: {call.data!r}")
+            await call.answer()
+            return
+        func, callback_data, accepts = resolved
+        kwargs["callback_data"] = callback_data
+        started = time.perf_counter()
+        try:
+            return await func(call, **{k: v for k, v in kwargs.items() if k in accepts})
+        except Exception:
+            metrics.handler_errors.inc(func.__name__)
+            raise
+        finally:
+            metrics.handler_latency.observe(time.perf_counter() - started, func.__name__)
@@ -0,0 +1,432 @@
+import asyncio
+import sqlite3
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'bot.db'
+WRITE_BATCH_SIZE = 200    # максимум операций в одной групповой транзакции
+WRITE_BATCH_DELAY = 0.005  # сколько ждать попутных записей перед коммитом, сек
+SEARCH_WINDOW = 5000       # сколько самых новых совпадений ранжирует поиск по жалобам
+
+
+class Database:
+    # Одно долгоживущее соединение, обслуживаемое отдельным потоком:
+    # все запросы выполняются последовательно вне event loop
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._conn = None
+        self._executor = None
+        self._writes = None
+        self._writer = None
+        self.last_activity = 0.0  # monotonic-время последнего запроса от обработчиков
+
+    @property
+    def connected(self):
+        return self._conn is not None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _timed(self, op, func, *args):
+        self.last_activity = time.monotonic()
+        started = time.perf_counter()
+        try:
+            return await self._run(func, *args)
+        finally:
+            metrics.db_latency.observe(time.perf_counter() - started, op)
+
+    async def _maintenance(self, op, func, *args):
+        # Фоновые операции не считаются активностью, по которой ищется период затишья
+        started = time.perf_counter()
+        try:
+            return await self._run(func, *args)
+        finally:
+            metrics.db_latency.observe(time.perf_counter() - started, op)
+
+    @property
+    def idle_for(self):
+        if self._writes is not None and not self._writes.empty():
+            return 0.0
+        return time.monotonic() - self.last_activity
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        # Инкрементальный auto_vacuum: освобождённые страницы возвращаются небольшими порциями.
+        # Новая база получает режим сразу, существующая — после полного VACUUM (один раз)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info("Включение auto_vacuum=INCREMENTAL: выполняется VACUUM")
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        self._conn = conn
+
+    async def connect(self):
+        if self._conn is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+            await self._run(self._connect)
+            self._writes = asyncio.Queue()
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self._writer is not None:
+            await self._writes.join()
+            self._writer.cancel()
+            self._writer = None
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+            self._executor.shutdown(wait=True)
+
+    # Базовые операции. label — метка op в метриках: помощники ниже передают своё имя,
+    # чтобы медленный запрос было видно по методу, а не по примитиву
+    async def fetchone(self, sql, params=(), label="fetchone"):
+        return await self._timed(label, lambda: self._conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=(), label="fetchall"):
+        return await self._timed(label, lambda: self._conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql, params=(), label="execute"):
+        def op():
+            with self._conn:
+                return self._conn.execute(sql, params)
+        return await self._timed(label, op)
+
+    async def transaction(self, func, *args, label="transaction"):
+        # func(conn, *args) выполняется в потоке БД внутри одной транзакции
+        def op():
+            with self._conn:
+                return func(self._conn, *args)
+        return await self._timed(label, op)
+
+    async def _keyset_page(self, query, key, params, cursor, backward, limit, label):
+        # Постраничная выборка по ключу: строки после cursor (или перед ним при backward).
+        # Возвращает (строки по возрастанию key, есть ли ещё строки в этом направлении)
+        if backward:
+            rows = await self.fetchall(f"{query} {key}<? ORDER BY {key} DESC LIMIT ?", (*params, cursor, limit + 1),
+                                       label=label)
+            return rows[:limit][::-1], len(rows) > limit
+        rows = await self.fetchall(f"{query} {key}>? ORDER BY {key} LIMIT ?", (*params, cursor, limit + 1),
+                                   label=label)
+        return rows[:limit], len(rows) > limit
+
+    # Групповая запись: операции из разных обработчиков коммитятся одной транзакцией
+    async def write(self, sql, params=(), label="write"):
+        # Возвращает lastrowid после коммита пачки, в которую попала операция.
+        # Под меткой label — время от постановки в очередь до коммита, сама пачка — write_batch
+        future = asyncio.get_running_loop().create_future()
+        self._writes.put_nowait((sql, params, future))
+        started = time.perf_counter()
+        try:
+            return await future
+        finally:
+            metrics.db_latency.observe(time.perf_counter() - started, label)
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._writes.get()]
+            if self._writes.qsize() < WRITE_BATCH_SIZE - 1:
+                await asyncio.sleep(WRITE_BATCH_DELAY)
+            while len(batch) < WRITE_BATCH_SIZE and not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+            try:
+                results = await self._timed("write_batch", self._commit_batch, batch)
+                for (_, _, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+
+    def _commit_batch(self, batch):
+        try:
+            with self._conn:
+                return [self._conn.execute(sql, params).lastrowid for sql, params, _ in batch]
+        except sqlite3.Error:
+            # Пачка откатилась целиком: повторяем по одной, чтобы ошибка досталась только своей операции
+            results = []
+            for sql, params, _ in batch:
+                try:
+                    with self._conn:
+                        results.append(self._conn.execute(sql, params).lastrowid)
+                except sqlite3.Error as e:
+                    results.append(e)
+            return results
+
+    # Схема
+    async def init_db(self, admin_id):
+        await self._run(migrate, self._conn)
+        await self.execute("INSERT OR IGNORE INTO admins (admin_id) VALUES (?)", (admin_id,), label="init_db")
+
+    # Общее состояние процессов: таблицы admins и blocked_users кэшируются в памяти каждого воркера
+    async def _shared_change(self, sql, params, label):
+        def op(conn):
+            conn.execute(sql, params)
+            conn.execute("UPDATE settings SET value=value+1 WHERE key='shared_version'")
+        await self.transaction(op, label=label)
+
+    async def get_shared_version(self):
+        row = await self.fetchone("SELECT value FROM settings WHERE key='shared_version'", label="get_shared_version")
+        return int(row[0]) if row else 0
+
+    # Администраторы
+    async def add_admin(self, admin_id):
+        await self._shared_change("INSERT OR IGNORE INTO admins (admin_id) VALUES (?)", (admin_id,), label="add_admin")
+
+    async def remove_admin(self, admin_id):
+        await self._shared_change("DELETE FROM admins WHERE admin_id=?", (admin_id,), label="remove_admin")
+
+    async def get_admins(self):
+        rows = await self.fetchall("SELECT admin_id FROM admins", label="get_admins")
+        return [row[0] for row in rows]
+
+    # Блокировки
+    async def block_user(self, user_id, ban_until):
+        await self._shared_change("INSERT OR REPLACE INTO blocked_users (user_id, ban_until) VALUES (?, ?)",
+                                  (user_id, ban_until), label="block_user")
+
+    async def unblock_user(self, user_id):
+        await self._shared_change("DELETE FROM blocked_users WHERE user_id=?", (user_id,), label="unblock_user")
+
+    async def unblock_expired(self, user_ids, now):
+        # Условие по сроку защищает от удаления бана, продлённого в это же время
+        def op(conn):
+            conn.executemany("DELETE FROM blocked_users WHERE user_id=? AND ban_until IS NOT NULL AND ban_until<?",
+                             [(user_id, now) for user_id in user_ids])
+            conn.execute("UPDATE settings SET value=value+1 WHERE key='shared_version'")
+        await self.transaction(op, label="unblock_expired")
+
+    async def get_blocked_users(self):
+        return await self.fetchall("SELECT user_id, ban_until FROM blocked_users", label="get_blocked_users")
+
+    async def get_blocked_page(self, cursor, backward, limit):
+        return await self._keyset_page("SELECT user_id, ban_until FROM blocked_users WHERE", "user_id",
+                                       (), cursor, backward, limit, label="get_blocked_page")
+
+    # Пользователи и ссылки
+    async def user_exists(self, user_id):
+        return await self.fetchone("SELECT 1 FROM users WHERE user_id=?", (user_id,), label="user_exists") is not None
+
+    async def add_user(self, user_id):
+        await self.write("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,), label="add_user")
+
+    async def get_legacy_link_owner(self, link):
+        # Владелец ссылки в старом формате (uuid), выданной до перехода на короткие коды
+        row = await self.fetchone("SELECT user_id FROM legacy_links WHERE link=?", (link,),
+                                  label="get_legacy_link_owner")
+        return row[0] if row else None
+
+    # Настройки
+    async def get_or_create_setting(self, key, default):
+        # При гонке двух запросов побеждает первая вставка
+        def op(conn):
+            conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, default))
+            return conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()[0]
+        return await self.transaction(op, label="get_or_create_setting")
+
+    # Счётчики админ-панели
+    async def get_stats(self):
+        rows = await self.fetchall("SELECT name, hour, value FROM stats", label="get_stats")
+        return {(name, hour): value for name, hour, value in rows}
+
+    async def add_stats(self, deltas, before):
+        # Прибавляет приращения {(name, hour): delta}, удаляет почасовые счётчики старше before;
+        # возвращает все счётчики после записи, включая приращения других процессов
+        def op(conn):
+            conn.executemany("INSERT INTO stats (name, hour, value) VALUES (?, ?, ?) "
+                             "ON CONFLICT (name, hour) DO UPDATE SET value=value+excluded.value",
+                             [(name, hour, delta) for (name, hour), delta in deltas.items()])
+            conn.execute("DELETE FROM stats WHERE hour>0 AND hour<?", (before,))
+            return {(name, hour): value for name, hour, value in conn.execute("SELECT name, hour, value FROM stats")}
+        return await self.transaction(op, label="add_stats")
+
+    # Сообщения
+    async def add_message(self, link_owner_id, sender_id, message, content_type="text", chat_id=None,
+                          source_message_id=None, fingerprint=None):
+        return await self.write("INSERT INTO messages (link_owner_id, sender_id, message, created_at, content_type, "
+                                "chat_id, source_message_id, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                (link_owner_id, sender_id, message, time.time(), content_type, chat_id,
+                                 source_message_id, fingerprint), label="add_message")
+
+    async def delete_message(self, msg_id):
+        await self.write("DELETE FROM messages WHERE id=?", (msg_id,), label="delete_message")
+
+    async def delete_report(self, msg_id):
+        # Удаляет сообщение с жалобой; возвращает число закрытых жалоб (0, если её уже закрыли)
+        def op(conn):
+            return conn.execute("DELETE FROM messages WHERE id=? AND is_reported=1", (msg_id,)).rowcount
+        return await self.transaction(op, label="delete_report")
+
+    async def delete_report_group(self, msg_id):
+        # Удаляет сообщение и все жалобы на копии того же содержимого; возвращает число закрытых жалоб
+        def op(conn):
+            row = conn.execute("SELECT fingerprint, is_reported FROM messages WHERE id=?", (msg_id,)).fetchone()
+            if not row:
+                return 0
+            conn.execute("DELETE FROM messages WHERE id=?", (msg_id,))
+            closed = row[1]
+            if row[0] is not None:
+                closed += conn.execute("DELETE FROM messages WHERE fingerprint=? AND is_reported=1",
+                                       (row[0],)).rowcount
+            return closed
+        return await self.transaction(op, label="delete_report_group")
+
+    async def get_message(self, msg_id):
+        return await self.fetchone("SELECT link_owner_id, sender_id, message, content_type FROM messages WHERE id=?",
+                                   (msg_id,), label="get_message")
+
+    async def report_message(self, msg_id):
+        def op(conn):
+            # Возвращает строку сообщения, признак того, что жалоба уже была,
+            # и число ранее поданных жалоб на копии того же содержимого
+            result = conn.execute("SELECT link_owner_id, sender_id, message, is_reported, content_type, chat_id, "
+                                  "source_message_id, fingerprint FROM messages WHERE id=?", (msg_id,)).fetchone()
+            if not result:
+                return None
+            if not result[3]:
+                conn.execute("UPDATE messages SET is_reported=1 WHERE id=?", (msg_id,))
+            copies = 0
+            if result[7] is not None:
+                copies = conn.execute("SELECT count(*) FROM messages WHERE fingerprint=? AND is_reported=1 AND id!=?",
+                                      (result[7], msg_id)).fetchone()[0]
+            return (*result[:7], copies)
+        return await self.transaction(op, label="report_message")
+
+    async def get_reported_page(self, cursor, backward, limit):
+        # Жалобы на копии одного содержимого — одной строкой (первой по id) с числом копий
+        return await self._keyset_page(
+            "SELECT id, link_owner_id, sender_id, message, content_type, CASE WHEN fingerprint IS NULL THEN 1 "
+            "ELSE (SELECT count(*) FROM messages c WHERE c.fingerprint=messages.fingerprint AND c.is_reported=1) END "
+            "FROM messages WHERE is_reported=1 AND (fingerprint IS NULL OR NOT EXISTS (SELECT 1 FROM messages e "
+            "WHERE e.fingerprint=messages.fingerprint AND e.is_reported=1 AND e.id<messages.id)) AND",
+            "id", (), cursor, backward, limit, label="get_reported_page")
+
+    async def search_reports(self, query, offset, limit):
+        # Полнотекстовый поиск по жалобам и архиву, лучшие совпадения (bm25) первыми. Ранжируются
+        # SEARCH_WINDOW самых новых совпадений: иначе частое слово заставит оценить весь архив.
+        # query — готовое выражение FTS5. Возвращает (строки (id, отправитель, владелец,
+        # сообщение, тип, в архиве), есть ли ещё)
+        rows = await self.fetchall(
+            "SELECT f.rowid, coalesce(m.sender_id, a.sender_id), coalesce(m.link_owner_id, a.link_owner_id), "
+            "coalesce(m.message, a.message), coalesce(m.content_type, a.content_type), m.id IS NULL "
+            "FROM (SELECT rowid, score FROM (SELECT rowid, rank AS score FROM reports_fts WHERE reports_fts MATCH ? "
+            "ORDER BY rowid DESC LIMIT ?) ORDER BY score LIMIT ? OFFSET ?) f "
+            "LEFT JOIN messages m ON m.id=f.rowid LEFT JOIN messages_archive a ON a.id=f.rowid ORDER BY f.score",
+            (query, SEARCH_WINDOW, limit + 1, offset), label="search_reports")
+        return rows[:limit], len(rows) > limit
+
+    async def get_sender_reports(self, sender_id, offset, limit):
+        # Жалобы на сообщения отправителя, включая архив, новые первыми.
+        # Возвращает (строки (id, владелец, сообщение, тип, в архиве), есть ли ещё)
+        rows = await self.fetchall(
+            "SELECT id, link_owner_id, message, content_type, 0 FROM messages WHERE sender_id=? AND is_reported=1 "
+            "UNION ALL SELECT id, link_owner_id, message, content_type, 1 FROM messages_archive WHERE sender_id=? "
+            "ORDER BY id DESC LIMIT ? OFFSET ?", (sender_id, sender_id, limit + 1, offset), label="get_sender_reports")
+        return rows[:limit], len(rows) > limit
+
+    # Рассылки
+    async def mark_user_active(self, user_id):
+        await self.write("UPDATE users SET inactive=0 WHERE user_id=? AND inactive=1", (user_id,),
+                         label="mark_user_active")
+
+    async def create_broadcast(self, admin_chat_id, progress_message_id, from_chat_id, message_id):
+        # Возвращает строку в формате get_running_broadcasts
+        def op(conn):
+            total = conn.execute("SELECT count(*) FROM users WHERE inactive=0").fetchone()[0]
+            now = time.time()
+            cursor = conn.execute("INSERT INTO broadcasts (admin_chat_id, progress_message_id, from_chat_id, "
+                                  "message_id, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  (admin_chat_id, progress_message_id, from_chat_id, message_id, total, now, now))
+            return (cursor.lastrowid, admin_chat_id, progress_message_id, from_chat_id, message_id, 0, total, 0, 0, 0)
+        return await self.transaction(op, label="create_broadcast")
+
+    async def get_running_broadcasts(self):
+        return await self.fetchall("SELECT id, admin_chat_id, progress_message_id, from_chat_id, message_id, "
+                                   "last_user_id, total, sent, failed, blocked FROM broadcasts "
+                                   "WHERE status='running' ORDER BY id", label="get_running_broadcasts")
+
+    async def get_broadcast_recipients(self, after_user_id, limit):
+        rows = await self.fetchall("SELECT user_id FROM users WHERE user_id>? AND inactive=0 ORDER BY user_id LIMIT ?",
+                                   (after_user_id, limit), label="get_broadcast_recipients")
+        return [row[0] for row in rows]
+
+    async def save_broadcast_progress(self, broadcast_id, last_user_id, sent, failed, blocked, inactive_ids):
+        # Контрольная точка и пометка заблокировавших бота — одной транзакцией; возвращает статус рассылки
+        def op(conn):
+            conn.execute("UPDATE broadcasts SET last_user_id=?, sent=?, failed=?, blocked=?, updated_at=? WHERE id=?",
+                         (last_user_id, sent, failed, blocked, time.time(), broadcast_id))
+            conn.executemany("UPDATE users SET inactive=1 WHERE user_id=?", [(user_id,) for user_id in inactive_ids])
+            return conn.execute("SELECT status FROM broadcasts WHERE id=?", (broadcast_id,)).fetchone()[0]
+        return await self.transaction(op, label="save_broadcast_progress")
+
+    async def cancel_broadcast(self, broadcast_id):
+        cursor = await self.execute("UPDATE broadcasts SET status='cancelled', updated_at=? "
+                                    "WHERE id=? AND status='running'", (time.time(), broadcast_id),
+                                    label="cancel_broadcast")
+        return cursor.rowcount > 0
+
+    async def finish_broadcast(self, broadcast_id, status):
+        await self.execute("UPDATE broadcasts SET status=?, updated_at=? WHERE id=?", (status, time.time(), broadcast_id),
+                           label="finish_broadcast")
+
+    # Хранение и обслуживание файла БД
+    async def purge_messages(self, before, limit):
+        # Удаляет до limit сообщений без жалоб, созданных раньше before; возвращает число удалённых.
+        # id растут вместе с created_at, поэтому старые строки — в начале таблицы
+        def op():
+            with self._conn:
+                return self._conn.execute(
+                    "DELETE FROM messages WHERE id IN (SELECT id FROM messages "
+                    "WHERE is_reported=0 AND created_at<? ORDER BY id LIMIT ?)", (before, limit)).rowcount
+        return await self._maintenance("purge_messages", op)
+
+    async def archive_reported(self, before, limit):
+        # Переносит до limit старых жалоб в messages_archive; возвращает число перенесённых
+        def op():
+            with self._conn:
+                ids = [row[0] for row in self._conn.execute(
+                    "SELECT id FROM messages WHERE is_reported=1 AND created_at<? ORDER BY id LIMIT ?",
+                    (before, limit))]
+                if not ids:
+                    return 0
+                marks = ",".join("?" * len(ids))
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO messages_archive (id, link_owner_id, sender_id, message, created_at, "
+                    f"content_type, chat_id, source_message_id, fingerprint, archived_at) SELECT id, link_owner_id, "
+                    f"sender_id, message, created_at, content_type, chat_id, source_message_id, fingerprint, ? "
+                    f"FROM messages "
+                    f"WHERE id IN ({marks})", (time.time(), *ids))
+                self._conn.execute(f"DELETE FROM messages WHERE id IN ({marks})", ids)
+                return len(ids)
+        return await self._maintenance("archive_reported", op)
+
+    async def incremental_vacuum(self, pages):
+        # Возвращает в ОС до pages свободных страниц; возвращает, сколько свободных страниц осталось
+        def op():
+            self._conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            return self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return await self._maintenance("incremental_vacuum", op)
+
+    async def checkpoint(self):
+        # Переносит WAL в основной файл, обрезает его и освобождает кэш страниц соединения
+        def op():
+            result = self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            self._conn.execute("PRAGMA shrink_memory")
+            return result
+        return await self._maintenance("checkpoint", op)
@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import CopyMessage, SendMessage
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 30      # сообщений в секунду на бота
+PER_CHAT_RATE = 1     # сообщений в секунду в один чат
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5   # базовая задержка перед повтором при сетевых ошибках, сек
+FANOUT_CONCURRENCY = 10
+FANOUT_TIMEOUT = 15   # общий срок рассылки одного уведомления нескольким чатам, сек
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        # Сколько ждать до появления токена
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ("method", "future", "attempt")
+
+    def __init__(self, method, future):
+        self.method = method
+        self.future = future
+        self.attempt = 0
+
+
+class _Chat:
+    __slots__ = ("jobs", "next_at", "busy")
+
+    def __init__(self):
+        self.jobs = deque()
+        self.next_at = 0.0
+        self.busy = False
+
+
+class DeliveryQueue:
+    # Единая очередь исходящих сообщений: общий лимит на бота, лимит на чат,
+    # порядок FIFO внутри чата, повторы при RetryAfter и сетевых ошибках
+    def __init__(self, bot, rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE, max_retries=MAX_RETRIES):
+        self.bot = bot
+        self.per_chat_interval = 1 / per_chat_rate
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(rate)
+        self._chats = {}
+        self._ready = []  # min-heap (next_at, seq, chat_id) чатов с ожидающими сообщениями
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._inflight = set()
+        self._task = None
+        self._last_cleanup = time.monotonic()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, timeout=5):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._inflight:
+            await asyncio.wait(self._inflight, timeout=timeout)
+        for chat in self._chats.values():
+            for job in chat.jobs:
+                job.future.cancel()
+        self._chats.clear()
+        self._ready.clear()
+
+    @property
+    def rate(self):
+        return self._bucket.rate
+
+    def set_rate(self, rate):
+        # Общий лимит делится между процессами-воркерами одного бота
+        self._bucket = TokenBucket(rate)
+
+    def submit(self, chat_id, method):
+        # Возвращает future с результатом вызова API (или исключением)
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat()
+        chat.jobs.append(_Job(method, future))
+        if len(chat.jobs) == 1 and not chat.busy:
+            self._push(chat_id, chat)
+        return future
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self.submit(chat_id, SendMessage(chat_id=chat_id, text=text, **kwargs))
+
+    def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        # Копия на стороне Telegram: вложения не скачиваются и не загружаются заново
+        return self.submit(chat_id, CopyMessage(chat_id=chat_id, from_chat_id=from_chat_id,
+                                                message_id=message_id, **kwargs))
+
+    def fan_out(self, chat_ids, text, concurrency=FANOUT_CONCURRENCY, timeout=FANOUT_TIMEOUT, **kwargs):
+        # Отправляет одно сообщение нескольким чатам параллельно; возвращает (доставлено, не доставлено)
+        return self._fan_out(chat_ids, lambda chat_id: self.send_message(chat_id, text, **kwargs),
+                             concurrency, timeout)
+
+    def fan_out_copy(self, chat_ids, from_chat_id, message_id, concurrency=FANOUT_CONCURRENCY,
+                     timeout=FANOUT_TIMEOUT, **kwargs):
+        return self._fan_out(chat_ids, lambda chat_id: self.copy_message(chat_id, from_chat_id, message_id, **kwargs),
+                             concurrency, timeout)
+
+    async def _fan_out(self, chat_ids, send_one, concurrency, timeout):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(chat_id):
+            async with semaphore:
+                await send_one(chat_id)
+
+        tasks = {asyncio.create_task(send(chat_id)): chat_id for chat_id in chat_ids}
+        if not tasks:
+            return [], []
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        sent, failed = [], []
+        for task, chat_id in tasks.items():
+            if task in done and task.exception() is None:
+                sent.append(chat_id)
+            else:
+                failed.append(chat_id)
+                if task in done:
+                    logger.warning(f"Не удалось отправить сообщение в чат {chat_id}: {task.exception()}")
+        return sent, failed
+
+    @property
+    def pending(self):
+        return sum(len(chat.jobs) for chat in self._chats.values())
+
+    def _push(self, chat_id, chat):
+        heapq.heappush(self._ready, (chat.next_at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            self._cleanup(now)
+            if not self._ready:
+                await self._wakeup.wait()
+                continue
+            next_at, _, chat_id = self._ready[0]
+            wait = max(next_at - now, self._paused_until - now, self._bucket.delay(now))
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+            job = chat.jobs.popleft()
+            if job.future.cancelled():
+                if chat.jobs:
+                    self._push(chat_id, chat)
+                continue
+            self._bucket.consume(now)
+            chat.busy = True
+            chat.next_at = now + self.per_chat_interval
+            task = asyncio.create_task(self._execute(chat_id, chat, job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, chat_id, chat, job):
+        api_method = job.method.__api_method__
+        started = time.perf_counter()
+        try:
+            result = await self.bot(job.method)
+        except TelegramRetryAfter as e:
+            # Флуд-лимит: приостанавливаем всю отправку и повторяем это сообщение первым
+            logger.warning(f"Flood limit, retry after {e.retry_after}s (chat {chat_id})")
+            metrics.telegram_retries.inc("retry_after")
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            chat.jobs.appendleft(job)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            job.attempt += 1
+            if job.attempt > self.max_retries:
+                logger.error(f"Не удалось доставить сообщение в чат {chat_id}: {e}")
+                metrics.telegram_failures.inc(api_method)
+                self._resolve(job, exception=e)
+            else:
+                metrics.telegram_retries.inc("network")
+                chat.next_at = time.monotonic() + RETRY_BACKOFF * 2 ** (job.attempt - 1)
+                chat.jobs.appendleft(job)
+        except Exception as e:
+            metrics.telegram_failures.inc(api_method)
+            self._resolve(job, exception=e)
+        else:
+            self._resolve(job, result=result)
+        finally:
+            metrics.telegram_latency.observe(time.perf_counter() - started, api_method)
+            chat.busy = False
+            if chat.jobs:
+                self._push(chat_id, chat)
+
+    @staticmethod
+    def _resolve(job, result=None, exception=None):
+        if job.future.done():
+            return
+        if exception is not None:
+            job.future.set_exception(exception)
+        else:
+            job.future.set_result(result)
+
+    def _cleanup(self, now):
+        # Удаляем состояние чатов, простаивающих дольше интервала лимита
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if not chat.jobs and not chat.busy and chat.next_at < now]:
+            del self._chats[chat_id]
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from aiogram import BaseMiddleware
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))  # апдейтов в обработке одновременно
+QUEUE_LIMIT = int(os.getenv("UPDATE_QUEUE_LIMIT", "1000"))  # принятых, но ещё не начатых апдейтов
+NOTICE_INTERVAL = 10  # не чаще одного ответа о перегрузке в чат за интервал, сек
+STOP_TIMEOUT = 10     # сколько ждать обработки очереди при остановке, сек
+
+
+class UpdateExecutor(BaseMiddleware):
+    # Внешний middleware апдейтов: вместо задачи на каждый апдейт — очередь и фиксированное
+    # число обработчиков. Апдейты одного чата обрабатываются строго по очереди (FSM не гоняется),
+    # разных чатов — параллельно. Сверх QUEUE_LIMIT апдейты отклоняются с коротким ответом
+    def __init__(self, delivery, concurrency=CONCURRENCY, limit=QUEUE_LIMIT):
+        self.delivery = delivery
+        self.concurrency = concurrency
+        self.limit = limit
+        self.pending = 0  # принятые и ещё не начатые
+        self.active = 0
+        self._chains = {}  # чат -> deque[(продолжение, monotonic-время приёма)]
+        self._ready = None  # чаты, у которых есть апдейт и нет обработчика; создаётся в цикле событий
+        self._workers = []
+        self._notified = {}  # чат -> monotonic-время последнего ответа о перегрузке
+        self._notices = set()
+
+    def start(self):
+        self._ready = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def join(self):
+        # Ждёт, пока все принятые апдейты будут обработаны
+        await self._ready.join()
+
+    async def close(self, timeout=STOP_TIMEOUT):
+        # Дообрабатывает принятые апдейты и останавливает обработчики
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не дождались обработки апдейтов при остановке, осталось: {self.pending}")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, key, run):
+        # run — корутинная функция без аргументов; False — очередь переполнена
+        if self.pending >= self.limit:
+            return False
+        chain = self._chains.get(key)
+        if chain is None:
+            chain = self._chains[key] = deque()
+            self._ready.put_nowait(key)
+        chain.append((run, time.monotonic()))
+        self.pending += 1
+        metrics.update_queue_depth.set(self.pending)
+        return True
+
+    async def _work(self):
+        while True:
+            key = await self._ready.get()
+            chain = self._chains[key]
+            run, accepted = chain.popleft()
+            self.pending -= 1
+            self.active += 1
+            metrics.update_queue_depth.set(self.pending)
+            metrics.updates_in_progress.set(self.active)
+            metrics.update_wait.observe(time.monotonic() - accepted)
+            try:
+                await run()
+            except Exception as e:
+                logger.error(f"Ошибка обработки апдейта чата {key}: {e}")
+            finally:
+                self.active -= 1
+                metrics.updates_in_progress.set(self.active)
+                # Следующий апдейт чата — в конец очереди, чтобы один чат не занимал обработчик
+                if chain:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chains[key]
+                self._ready.task_done()
+
+    async def __call__(self, handler, event, data):
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat is not None else user.id if user is not None else 0
+
+        async def run():
+            # FSM-состояние прочитано при приёме и могло измениться, пока апдейт ждал предыдущих
+            state = data.get("state")
+            if state is not None:
+                data["raw_state"] = await state.get_state()
+            return await handler(event, data)
+
+        if self.submit(key, run):
+            return None
+        metrics.updates_shed.inc(event.event_type)
+        self._notify(key, event)
+        return None
+
+    def _notify(self, key, event):
+        now = time.monotonic()
+        if now - self._notified.get(key, 0.0) < NOTICE_INTERVAL:
+            return
+        if len(self._notified) >= self.limit:
+            self._notified = {chat: at for chat, at in self._notified.items() if now - at < NOTICE_INTERVAL}
+        self._notified[key] = now
+        text = "⏳ Бот перегружен, повторите через несколько секунд."
+        if event.callback_query is not None:
+            notice = event.callback_query.answer(text)
+        elif event.message is not None:
+            notice = self.delivery.send_message(key, text)
+        else:
+            return
+        task = asyncio.ensure_future(notice)
+        self._notices.add(task)
+        task.add_done_callback(self._notice_done)
+
+    def _notice_done(self, task):
+        self._notices.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Не удалось ответить о перегрузке: {task.exception()}")
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+
+# Отпечаток содержимого: хеш нормализованного текста (регистр, пунктуация и пробелы не влияют)
+# и file_unique_id вложения. Совпадают копии, а не похожие сообщения — это дёшево и без ложных срабатываний
+DUPLICATE_LIMIT = int(os.getenv("DUPLICATE_LIMIT", "5"))  # копий одного содержимого за окно, 0 — без ограничения
+DUPLICATE_WINDOW = 600     # окно подсчёта копий, сек
+INDEX_SIZE = 50000         # отпечатков в памяти, самые старые вытесняются
+MIN_TEXT_LENGTH = 24       # короткие тексты ("привет") совпадают у разных людей — не учитываем
+# Стикеры и GIF массово переиспользуются обычными пользователями
+MEDIA_TYPES = {"photo", "video", "document", "audio", "voice", "video_note"}
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def fingerprint(message):
+    # 64-битное целое со знаком (помещается в INTEGER SQLite) или None, если сообщение не учитывается
+    text = normalize(message.text or message.caption or "")
+    media = getattr(message, message.content_type, None) if message.content_type in MEDIA_TYPES else None
+    if isinstance(media, list):
+        media = media[-1]
+    file_id = media.file_unique_id if media is not None else ""
+    if not file_id and len(text) < MIN_TEXT_LENGTH:
+        return None
+    digest = hashlib.blake2b(f"{file_id}\0{text}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class DuplicateIndex:
+    # LRU отпечаток -> [начало окна, копий в окне]; ограничен по размеру, не по времени жизни
+    def __init__(self, limit=DUPLICATE_LIMIT, window=DUPLICATE_WINDOW, size=INDEX_SIZE):
+        self.limit = limit
+        self.window = window
+        self.size = size
+        self._entries = OrderedDict()
+
+    def allow(self, fp, now=None):
+        # Учитывает копию и возвращает, можно ли её пропустить
+        if fp is None or self.limit <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        entry = self._entries.get(fp)
+        if entry is None or now - entry[0] >= self.window:
+            entry = self._entries[fp] = [now, 0]
+        self._entries.move_to_end(fp)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        entry[1] += 1
+        return entry[1] <= self.limit
+
+    def __len__(self):
+        return len(self._entries)
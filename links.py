@@ -0,0 +1,57 @@
+import hashlib
+import secrets
+import string
+
+# Коды ссылок: user_id, переставленный ключевой перестановкой (сеть Фейстеля на 64 битах) и записанный
+# в base62 — до 11 символов. Код обратим в user_id без поиска по таблице, а без ключа соседние
+# коды не подобрать: любая строка декодируется в случайное 64-битное число
+ALPHABET = string.digits + string.ascii_lowercase + string.ascii_uppercase
+MAX_CODE_LENGTH = 11  # 62**11 > 2**64
+ROUNDS = 4
+_INDEX = {char: i for i, char in enumerate(ALPHABET)}
+_MASK32 = 0xFFFFFFFF
+
+
+def generate_key():
+    return secrets.token_hex(16)
+
+
+class LinkCodec:
+    def __init__(self, key):
+        self._keys = [hashlib.blake2b(f"{key}:{i}".encode(), digest_size=16).digest() for i in range(ROUNDS)]
+
+    def _round(self, i, half):
+        digest = hashlib.blake2b(half.to_bytes(4, "big"), digest_size=4, key=self._keys[i]).digest()
+        return int.from_bytes(digest, "big")
+
+    def encode(self, user_id):
+        left, right = user_id >> 32, user_id & _MASK32
+        for i in range(ROUNDS):
+            left, right = right, left ^ self._round(i, right)
+        value = (left << 32) | right
+        chars = []
+        while True:
+            value, digit = divmod(value, 62)
+            chars.append(ALPHABET[digit])
+            if not value:
+                return "".join(reversed(chars))
+
+    def decode(self, code):
+        # user_id или None для строки, которая не может быть кодом
+        if not code or len(code) > MAX_CODE_LENGTH:
+            return None
+        value = 0
+        for char in code:
+            digit = _INDEX.get(char)
+            if digit is None:
+                return None
+            value = value * 62 + digit
+        if value >> 64:
+            return None
+        # Обратная перестановка: раунды в обратном порядке с переставленными половинами
+        left, right = value >> 32, value & _MASK32
+        for i in reversed(range(ROUNDS)):
+            left, right = right ^ self._round(i, left), left
+        user_id = (left << 32) | right
+        # Половина случайных строк даёт число вне знакового 64-битного INTEGER SQLite
+        return user_id if not user_id >> 63 else None
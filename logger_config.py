@@ -1,43 +1,126 @@
 import os
+import json
+import time
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from multiprocessing import current_process
+from datetime import datetime
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
-def setup_logger():
+# Сколько одинаковых предупреждений/ошибок из одного места кода пропускать за окно
+REPEAT_LIMIT = int(os.getenv("LOG_REPEAT_LIMIT", "5"))
+REPEAT_WINDOW = float(os.getenv("LOG_REPEAT_WINDOW", "60"))  # сек
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна запись — одна строка JSON
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            # Трейсбек уже добавлен в текст сообщения при постановке в очередь
+            "message": record.getMessage(),
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RepeatFilter(logging.Filter):
+    # Ограничивает поток повторяющихся WARNING/ERROR: сообщения собираются f-строками,
+    # поэтому повтором считается запись из того же места кода (файл + строка).
+    # Работает в потоке вызывающего, до постановки записи в очередь
+    def __init__(self, limit=REPEAT_LIMIT, window=REPEAT_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._seen = {}  # (файл, строка) -> [начало окна, записей в окне, подавлено]
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or self.limit <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        state = self._seen.get(key)
+        if state is None or now - state[0] >= self.window:
+            suppressed = state[2] if state is not None else 0
+            self._seen[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.getMessage()} (подавлено похожих записей: {suppressed})"
+                record.args = None
+            return True
+        state[1] += 1
+        if state[1] <= self.limit:
+            return True
+        state[2] += 1
+        return False
+
+
+def setup_logger(json_lines=None):
     # Создаём директорию logs, если её нет
     if not os.path.exists('logs'):
         os.makedirs('logs')
 
-    # Путь к файлу логов
-    log_file_path = os.path.join('logs', 'log.txt')
+    # Путь к файлу логов: у каждого процесса-воркера свой файл, ротация не пересекается
+    process_name = current_process().name
+    log_file_name = 'log.txt' if process_name == 'MainProcess' else f'log-{process_name}.txt'
+    log_file_path = os.path.join('logs', log_file_name)
 
     # Настраиваем обработчик логов с ротацией
     rotating_handler = RotatingFileHandler(
-        log_file_path, 
+        log_file_path,
         maxBytes=2 * 1024 * 1024,  # 2 MB
         backupCount=5,  # Максимум 5 файлов с логами
         encoding='utf-8'
     )
 
-    # Формат для логов
+    # Формат для логов: LOG_FORMAT=json — JSON-строки в файле
+    if json_lines is None:
+        json_lines = os.getenv("LOG_FORMAT", "").lower() == "json"
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    rotating_handler.setFormatter(formatter)
+    rotating_handler.setFormatter(JsonFormatter() if json_lines else formatter)
 
     # Обработчик для вывода логов в консоль
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
 
+    # Запись в файл и консоль — в фоновом потоке, чтобы не блокировать event loop
+    shutdown_logger()
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RepeatFilter())
+
+    global _listener
+    _listener = QueueListener(log_queue, rotating_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+
     # Настраиваем корневой логгер
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
 
     # Очищаем существующие обработчики
     root_logger.handlers.clear()
-    
-    # Добавляем новые обработчики
-    root_logger.addHandler(rotating_handler)
-    root_logger.addHandler(console_handler)
+
+    # Добавляем обработчик-очередь
+    root_logger.addHandler(queue_handler)
 
     # Отключаем логгирование aiogram.event на уровне INFO
     logging.getLogger('aiogram.event').setLevel(logging.WARNING)
 
-    return root_logger
\ No newline at end of file
+    return root_logger
+
+
+def shutdown_logger():
+    # Дописывает всё, что осталось в очереди, и останавливает фоновый поток
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+atexit.register(shutdown_logger)
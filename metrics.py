@@ -0,0 +1,157 @@
+import bisect
+import logging
+import time
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, сек
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        registry.register(self)
+
+    def _labels(self, labels):
+        if not self.labelnames:
+            return ""
+        pairs = ",".join(f'{name}="{value}"' for name, value in zip(self.labelnames, labels))
+        return "{" + pairs + "}"
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, value=1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        yield from super().render()
+        for labels, value in self._values.items():
+            yield f"{self.name}{self._labels(labels)} {value}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        # func — значение снимается в момент запроса метрик, без затрат на горячем пути
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def render(self):
+        yield from super().render()
+        if self.func is not None:
+            yield f"{self.name} {self.func()}"
+        for labels, value in self._values.items():
+            yield f"{self.name}{self._labels(labels)} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            # [счётчики по корзинам (+Inf последней), сумма, количество]
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        yield from super().render()
+        for labels, (counts, total, count) in self._values.items():
+            base = self._labels(labels)[1:-1]
+            prefix = base + "," if base else ""
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}'
+            yield f"{self.name}_sum{self._labels(labels)} {total}"
+            yield f"{self.name}_count{self._labels(labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_latency = Histogram("bot_handler_seconds", "Время работы обработчика апдейта", ("handler",))
+handler_errors = Counter("bot_handler_errors_total", "Необработанные исключения в обработчиках", ("handler",))
+db_latency = Histogram("bot_db_query_seconds", "Время запроса к БД, включая ожидание потока БД", ("op",))
+throttled = Counter("bot_throttled_total", "Анонимные сообщения, отброшенные ограничением частоты", ("scope",))
+duplicates_dropped = Counter("bot_duplicates_dropped_total", "Анонимные сообщения, отброшенные как массовые копии")
+broadcast_messages = Counter("bot_broadcast_messages_total", "Сообщения рассылок по результату", ("result",))
+update_queue_depth = Gauge("bot_update_queue_depth", "Принятые апдейты, ожидающие обработчика")
+updates_in_progress = Gauge("bot_updates_in_progress", "Апдейты в обработке")
+update_wait = Histogram("bot_update_queue_wait_seconds", "Время апдейта в очереди до начала обработки")
+updates_shed = Counter("bot_updates_shed_total", "Апдейты, отклонённые из-за переполнения очереди", ("type",))
+updates_forwarded = Counter("bot_updates_forwarded_total", "Апдейты, переданные воркерам приёмником", ("worker",))
+retention_rows = Counter("bot_retention_rows_total", "Сообщения, удалённые или архивированные очисткой", ("action",))
+telegram_latency = Histogram("bot_telegram_request_seconds", "Время исходящего запроса к Bot API", ("method",))
+telegram_retries = Counter("bot_telegram_retries_total", "Повторы исходящих запросов к Bot API", ("reason",))
+telegram_failures = Counter("bot_telegram_failures_total", "Исходящие запросы, завершившиеся ошибкой", ("method",))
+
+
+class MetricsMiddleware(BaseMiddleware):
+    # Внутренний middleware: к моменту вызова уже известен выбранный обработчик
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, name)
+
+
+async def handle_metrics(request):
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host, port):
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,196 @@
+import logging
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+# Миграции схемы. Каждая применяется один раз, в своей транзакции, по возрастанию версии.
+# Новые миграции добавляются в конец списка MIGRATIONS; уже выпущенные не меняются.
+
+def _initial_schema(c):
+    # Совпадает с прежним init_db, поэтому безопасна для уже существующих баз
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (user_id INTEGER PRIMARY KEY, unique_link TEXT UNIQUE)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS messages
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  link_owner_id INTEGER,
+                  sender_id INTEGER,
+                  message TEXT,
+                  is_reported INTEGER DEFAULT 0)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS admins
+                 (admin_id INTEGER PRIMARY KEY)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS blocked_users
+                 (user_id INTEGER PRIMARY KEY, ban_until TEXT)''')
+    c.execute("PRAGMA table_info(blocked_users)")
+    columns = [col[1] for col in c.fetchall()]
+    if 'ban_until' not in columns:
+        c.execute("ALTER TABLE blocked_users ADD COLUMN ban_until TEXT")
+        logger.info("Added column 'ban_until' to blocked_users table")
+
+
+def _hot_query_indexes(c):
+    # Частичный индекс: в нём только жалобы, по нему идёт постраничный список жалоб
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_reported ON messages(id) WHERE is_reported=1")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_link_owner ON messages(link_owner_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_blocked_users_ban_until ON blocked_users(ban_until)")
+
+
+def _fsm_states(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS fsm_states
+                 (key TEXT PRIMARY KEY, state TEXT, data TEXT, updated_at REAL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)")
+
+
+def _message_retention(c):
+    # Время создания для очистки старых сообщений; существующим строкам ставим время миграции,
+    # чтобы срок хранения отсчитывался от обновления, а не удалял всё сразу
+    c.execute("ALTER TABLE messages ADD COLUMN created_at REAL")
+    c.execute("UPDATE messages SET created_at=?", (datetime.now().timestamp(),))
+    # Обработанные жалобы, вынесенные из messages по истечении срока хранения
+    c.execute('''CREATE TABLE IF NOT EXISTS messages_archive
+                 (id INTEGER PRIMARY KEY,
+                  link_owner_id INTEGER,
+                  sender_id INTEGER,
+                  message TEXT,
+                  created_at REAL,
+                  archived_at REAL)''')
+
+
+def _message_refs(c):
+    # Ссылка на исходное сообщение отправителя: пересылка через copy_message без хранения вложений.
+    # В message остаётся только текст или подпись — для просмотра жалоб
+    for table in ("messages", "messages_archive"):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN content_type TEXT DEFAULT 'text'")
+        c.execute(f"ALTER TABLE {table} ADD COLUMN chat_id INTEGER")
+        c.execute(f"ALTER TABLE {table} ADD COLUMN source_message_id INTEGER")
+
+
+def _fingerprints(c):
+    # Отпечаток содержимого для поиска массовых копий и группировки жалоб
+    c.execute("ALTER TABLE messages ADD COLUMN fingerprint INTEGER")
+    c.execute("ALTER TABLE messages_archive ADD COLUMN fingerprint INTEGER")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_fingerprint ON messages(fingerprint) WHERE fingerprint IS NOT NULL")
+
+
+def _broadcasts(c):
+    # inactive=1 — пользователь заблокировал бота, рассылки его пропускают до следующего /start
+    c.execute("ALTER TABLE users ADD COLUMN inactive INTEGER DEFAULT 0")
+    c.execute('''CREATE TABLE IF NOT EXISTS broadcasts
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  admin_chat_id INTEGER,
+                  progress_message_id INTEGER,
+                  from_chat_id INTEGER,
+                  message_id INTEGER,
+                  last_user_id INTEGER DEFAULT 0,
+                  total INTEGER,
+                  sent INTEGER DEFAULT 0,
+                  failed INTEGER DEFAULT 0,
+                  blocked INTEGER DEFAULT 0,
+                  status TEXT DEFAULT 'running',
+                  created_at REAL,
+                  updated_at REAL)''')
+
+
+def _short_links(c):
+    # Код ссылки теперь вычисляется из user_id (links.py), поэтому users хранит только id.
+    # Выданные uuid-ссылки продолжают работать через legacy_links
+    c.execute('''CREATE TABLE IF NOT EXISTS legacy_links
+                 (link TEXT PRIMARY KEY, user_id INTEGER) WITHOUT ROWID''')
+    c.execute("INSERT OR IGNORE INTO legacy_links (link, user_id) "
+              "SELECT unique_link, user_id FROM users WHERE unique_link IS NOT NULL")
+    # UNIQUE-столбец нельзя удалить через DROP COLUMN — пересоздаём таблицу
+    c.execute("CREATE TABLE users_new (user_id INTEGER PRIMARY KEY, inactive INTEGER DEFAULT 0)")
+    c.execute("INSERT INTO users_new (user_id, inactive) SELECT user_id, inactive FROM users")
+    c.execute("DROP TABLE users")
+    c.execute("ALTER TABLE users_new RENAME TO users")
+    c.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+
+
+def _shared_version(c):
+    # Счётчик изменений банов и админов: воркеры перечитывают свои копии, когда он растёт
+    c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('shared_version', 0)")
+
+
+def _report_search(c):
+    # Полнотекстовый индекс жалоб и архива жалоб; rowid — id сообщения. Индекс без копии текста
+    # (content=''): текст берётся из messages/messages_archive, а удаление из индекса требует
+    # исходного текста — его передают триггеры. Сообщение попадает в индекс при жалобе
+    # и уходит из него при удалении; при переносе в архив строка сначала вставляется
+    # в messages_archive, поэтому остаётся в индексе
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts "
+              "USING fts5(message, content='', tokenize='unicode61 remove_diacritics 2')")
+    c.execute("INSERT INTO reports_fts (rowid, message) SELECT id, coalesce(message, '') FROM messages WHERE is_reported=1")
+    c.execute("INSERT INTO reports_fts (rowid, message) SELECT id, coalesce(message, '') FROM messages_archive "
+              "WHERE id NOT IN (SELECT id FROM messages WHERE is_reported=1)")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS reports_fts_report AFTER UPDATE OF is_reported ON messages
+                 WHEN new.is_reported=1 AND old.is_reported=0
+                 BEGIN
+                     INSERT INTO reports_fts (rowid, message) VALUES (new.id, coalesce(new.message, ''));
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS reports_fts_delete AFTER DELETE ON messages
+                 WHEN old.is_reported=1 AND NOT EXISTS (SELECT 1 FROM messages_archive WHERE id=old.id)
+                 BEGIN
+                     INSERT INTO reports_fts (reports_fts, rowid, message)
+                     VALUES ('delete', old.id, coalesce(old.message, ''));
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS reports_fts_archive_delete AFTER DELETE ON messages_archive
+                 BEGIN
+                     INSERT INTO reports_fts (reports_fts, rowid, message)
+                     VALUES ('delete', old.id, coalesce(old.message, ''));
+                 END''')
+    # Поиск жалоб по отправителю в архиве (в messages уже есть idx_messages_sender)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_archive_sender ON messages_archive(sender_id)")
+
+
+def _dashboard_stats(c):
+    # Счётчики админ-панели: hour=0 — итоговое значение, иначе начало часа (unix time)
+    # для почасового счётчика. Дальше их ведёт stats.Stats, здесь — начальные значения
+    c.execute('''CREATE TABLE IF NOT EXISTS stats
+                 (name TEXT, hour INTEGER, value INTEGER, PRIMARY KEY (name, hour)) WITHOUT ROWID''')
+    c.execute("INSERT OR REPLACE INTO stats (name, hour, value) SELECT 'users', 0, count(*) FROM users")
+    c.execute("INSERT OR REPLACE INTO stats (name, hour, value) "
+              "SELECT 'open_reports', 0, count(*) FROM messages WHERE is_reported=1")
+    # Почасовые счётчики хранятся двое суток. Миграция 4 проставила всем старым сообщениям
+    # время своего запуска — настоящее время создания есть только у более поздних
+    row = c.execute("SELECT applied_at FROM schema_migrations WHERE version=4").fetchone()
+    since = max(time.time() - 2 * 86400, datetime.fromisoformat(row[0]).timestamp() if row else time.time())
+    c.execute("INSERT OR REPLACE INTO stats (name, hour, value) "
+              "SELECT 'messages', CAST(created_at / 3600 AS INTEGER) * 3600, count(*) FROM messages "
+              "WHERE created_at>? GROUP BY 2", (since,))
+
+
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "indexes for hot queries", _hot_query_indexes),
+    (3, "persistent FSM storage", _fsm_states),
+    (4, "message retention", _message_retention),
+    (5, "message references for media relay", _message_refs),
+    (6, "content fingerprints", _fingerprints),
+    (7, "broadcasts", _broadcasts),
+    (8, "short link codes", _short_links),
+    (9, "shared state version", _shared_version),
+    (10, "report search", _report_search),
+    (11, "dashboard stats", _dashboard_stats),
+]
+
+
+def migrate(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations
+                    (version INTEGER PRIMARY KEY, description TEXT, applied_at TEXT)''')
+    conn.commit()
+    applied = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+    for version, description, step in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            conn.execute("BEGIN")
+            step(conn.cursor())
+            conn.execute("INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+                         (version, description, datetime.now().isoformat()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"Применена миграция {version}: {description}")
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import os
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сроки хранения: сообщения без жалоб удаляются, жалобы переносятся в messages_archive.
+# 0 — не ограничивать
+MESSAGE_RETENTION_DAYS = float(os.getenv("MESSAGE_RETENTION_DAYS", "30"))
+REPORT_RETENTION_DAYS = float(os.getenv("REPORT_RETENTION_DAYS", "180"))
+RETENTION_INTERVAL = 3600  # как часто запускать очистку, сек
+BATCH_SIZE = 500           # строк за одну транзакцию
+BATCH_PAUSE = 0.05         # пауза между транзакциями, чтобы не занимать поток БД надолго
+VACUUM_PAGES = 256         # страниц за один шаг incremental_vacuum
+QUIET_PERIOD = 2.0         # сколько БД должна простаивать, чтобы начать сжатие файла, сек
+QUIET_WAIT = 300           # дольше затишья не ждём: сжатие идёт мелкими шагами и так, сек
+
+
+async def _in_batches(step, before):
+    total = 0
+    while True:
+        count = await step(before, BATCH_SIZE)
+        total += count
+        if count < BATCH_SIZE:
+            return total
+        await asyncio.sleep(BATCH_PAUSE)
+
+
+async def _wait_quiet(db):
+    deadline = time.monotonic() + QUIET_WAIT
+    while db.idle_for < QUIET_PERIOD and time.monotonic() < deadline:
+        await asyncio.sleep(QUIET_PERIOD)
+
+
+async def compact(db, now=None, stats=None):
+    now = time.time() if now is None else now
+    purged = archived = 0
+    if MESSAGE_RETENTION_DAYS > 0:
+        purged = await _in_batches(db.purge_messages, now - MESSAGE_RETENTION_DAYS * 86400)
+        metrics.retention_rows.inc("purged", value=purged)
+    if REPORT_RETENTION_DAYS > 0:
+        archived = await _in_batches(db.archive_reported, now - REPORT_RETENTION_DAYS * 86400)
+        metrics.retention_rows.inc("archived", value=archived)
+        if stats is not None:
+            stats.reports_closed(archived)
+    if purged or archived:
+        logger.info(f"Очистка БД: удалено сообщений {purged}, перенесено жалоб в архив {archived}")
+
+    # Сжатие файла и контрольная точка WAL — в период затишья
+    await _wait_quiet(db)
+    while await db.incremental_vacuum(VACUUM_PAGES):
+        await asyncio.sleep(BATCH_PAUSE)
+        await _wait_quiet(db)
+    await db.checkpoint()
+    return purged, archived
+
+
+async def run_retention(db, stats=None, interval=RETENTION_INTERVAL):
+    while True:
+        try:
+            await compact(db, stats=stats)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка очистки БД: {e}")
+        await asyncio.sleep(interval)
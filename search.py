@@ -0,0 +1,41 @@
+import re
+from html import escape
+
+# Поиск по жалобам: запрос админа превращается в выражение FTS5 из слов в кавычках,
+# так что кавычки, AND/OR/NOT и прочий синтаксис FTS5 в тексте не ломают запрос
+MAX_TERMS = 8
+PREFIX_LENGTH = 3    # слова от этой длины ищутся как префиксы («курс» найдёт «курсы»)
+FRAGMENT_LENGTH = 80  # длина фрагмента сообщения в результатах, символов
+_WORD = re.compile(r"\w+")
+
+
+def parse_query(text):
+    # Слова запроса в нижнем регистре; пустой список — искать нечего
+    return _WORD.findall(text.lower())[:MAX_TERMS]
+
+
+def build_query(terms):
+    return " ".join(f'"{term}"*' if len(term) >= PREFIX_LENGTH else f'"{term}"' for term in terms)
+
+
+def _term_pattern(term):
+    # Как в build_query: длинные слова — префиксы, короткие — целиком
+    return rf"\b{re.escape(term)}\w*" if len(term) >= PREFIX_LENGTH else rf"\b{re.escape(term)}\b"
+
+
+def highlight(text, terms, length=FRAGMENT_LENGTH):
+    # Фрагмент текста вокруг первого совпадения в HTML: текст экранируется, совпадения — жирным
+    text = text or ""
+    pattern = re.compile("|".join(_term_pattern(term) for term in terms), re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - length // 4) if first and len(text) > length else 0
+    end = min(len(text), start + length)
+    piece = text[start:end]
+    parts = []
+    last = 0
+    for match in pattern.finditer(piece):
+        parts.append(escape(piece[last:match.start()]))
+        parts.append(f"<b>{escape(match.group())}</b>")
+        last = match.end()
+    parts.append(escape(piece[last:]))
+    return ("…" if start else "") + "".join(parts) + ("…" if end < len(text) else "")
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import secrets
+
+from aiogram.methods import GetUpdates
+from aiohttp import web
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30        # long polling в процессе-приёмнике, сек
+READ_TIMEOUT = 0.5       # как часто воркер проверяет остановку, ожидая апдейт, сек
+SUPERVISE_INTERVAL = 1.0
+STOP_TIMEOUT = 10        # сколько ждать завершения воркеров при остановке, сек
+
+
+def update_user_id(update):
+    # Пользователь, от которого пришёл апдейт (или чат, если пользователя нет); 0 — не определить
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+def _read(updates):
+    try:
+        return updates.get(timeout=READ_TIMEOUT)
+    except queue.Empty:
+        return {}
+
+
+async def consume(updates, handle):
+    # Цикл воркера: апдейты из очереди процесса-приёмника; None — команда остановки.
+    # handle только ставит апдейт в очередь UpdateExecutor, поэтому вызывается по порядку
+    loop = asyncio.get_running_loop()
+    while True:
+        update = await loop.run_in_executor(None, _read, updates)
+        if update is None:
+            break
+        if not update:
+            continue
+        try:
+            await handle(update)
+        except Exception as e:
+            logger.error(f"Не удалось принять апдейт {update.get('update_id')}: {e}")
+
+
+class Ingress:
+    # Процесс-приёмник: получает апдейты и раздаёт их воркерам по user_id,
+    # так что все апдейты одного пользователя обрабатывает один воркер по порядку
+    def __init__(self, target, workers):
+        self.target = target  # target(index, workers, updates, ready) — точка входа процесса-воркера
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue() for _ in range(workers)]
+        self.ready = [self._context.Event() for _ in range(workers)]  # воркер запущен и принимает апдейты
+        self.processes = [None] * workers
+        self._stopping = False
+
+    def _spawn(self, index):
+        self.ready[index].clear()
+        process = self._context.Process(target=self.target,
+                                        args=(index, self.workers, self.queues[index], self.ready[index]),
+                                        name=f"worker-{index}")
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"Запущено воркеров: {self.workers}")
+
+    def alive(self):
+        return all(process is not None and process.is_alive() and ready.is_set()
+                   for process, ready in zip(self.processes, self.ready))
+
+    def dispatch(self, update):
+        index = update_user_id(update) % self.workers
+        self.queues[index].put(update)
+        metrics.updates_forwarded.inc(str(index))
+
+    async def supervise(self):
+        while not self._stopping:
+            for index, process in enumerate(self.processes):
+                if not process.is_alive() and not self._stopping:
+                    logger.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапуск")
+                    self._spawn(index)
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+
+    async def stop(self):
+        self._stopping = True
+        for updates in self.queues:
+            updates.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"Воркер {process.name} не завершился, принудительная остановка")
+                process.terminate()
+
+    async def poll(self, bot, allowed_updates):
+        offset = None
+        while True:
+            try:
+                updates = await bot(GetUpdates(offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates),
+                                    request_timeout=POLL_TIMEOUT + 10)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка получения апдейтов: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                self.dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+                offset = update.update_id + 1
+
+    async def start_webhook(self, bot, allowed_updates, base_url, path, host, port, secret):
+        # Ответ 200 сразу после постановки в очередь воркера
+        async def handle(request):
+            token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not secrets.compare_digest(token, secret):
+                return web.Response(status=401)
+            self.dispatch(await request.json())
+            return web.json_response({})
+
+        async def healthz(request):
+            return web.json_response({"status": "ok"})
+
+        async def readyz(request):
+            is_ready = self.alive()
+            return web.json_response({"ready": is_ready}, status=200 if is_ready else 503)
+
+        app = web.Application()
+        app.router.add_post(path, handle)
+        app.router.add_get("/healthz", healthz)
+        app.router.add_get("/readyz", readyz)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        await bot.set_webhook(f"{base_url.rstrip('/')}{path}", secret_token=secret, allowed_updates=allowed_updates)
+        logger.info(f"Вебхук принимает апдейты на http://{host}:{port}{path}, воркеров: {self.workers}")
+        return runner
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 30  # как часто приращения счётчиков записываются в БД, сек
+HOURS_KEPT = 48      # сколько часов хранятся почасовые счётчики
+HOUR = 3600
+
+
+def _hour(ts):
+    return int(ts // HOUR) * HOUR
+
+
+class Stats:
+    # Счётчики админ-панели без COUNT(*) по таблицам: пути записи меняют их в памяти,
+    # раз в FLUSH_INTERVAL приращения прибавляются к таблице stats. Каждый процесс пишет
+    # только свои приращения, поэтому воркеры не затирают счётчики друг друга,
+    # а после записи получают и чужие. Ключ — (имя, начало часа), 0 — итоговый счётчик
+    def __init__(self, db):
+        self.db = db
+        self._saved = {}    # значения из БД на момент последней записи
+        self._pending = {}  # приращения, ещё не записанные в БД
+        self._task = None
+
+    async def load(self):
+        self._saved = await self.db.get_stats()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    def add(self, name, value=1, hourly=False):
+        key = (name, _hour(time.time()) if hourly else 0)
+        self._pending[key] = self._pending.get(key, 0) + value
+
+    # События путей записи
+    def user_added(self):
+        self.add("users")
+
+    def message_sent(self):
+        self.add("messages", hourly=True)
+
+    def report_opened(self):
+        self.add("open_reports")
+
+    def reports_closed(self, count):
+        if count:
+            self.add("open_reports", -count)
+
+    def delivery_failed(self):
+        self.add("delivery_failures", hourly=True)
+
+    def get(self, name, hour=0):
+        key = (name, hour)
+        return self._saved.get(key, 0) + self._pending.get(key, 0)
+
+    def since(self, name, start, now=None):
+        # Сумма почасовых счётчиков с часа, в который попадает start: не больше HOURS_KEPT ключей
+        now = time.time() if now is None else now
+        return sum(self.get(name, hour) for hour in range(_hour(max(start, now - HOURS_KEPT * HOUR)),
+                                                          _hour(now) + 1, HOUR))
+
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        return {
+            "users": self.get("users"),
+            "messages_today": self.since("messages", midnight, now),
+            "messages_hour": self.get("messages", _hour(now)),
+            "open_reports": self.get("open_reports"),
+            "delivery_failures_today": self.since("delivery_failures", midnight, now),
+        }
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        try:
+            self._saved = await self.db.add_stats(pending, _hour(time.time()) - HOURS_KEPT * HOUR)
+        except Exception:
+            # Запись не удалась: возвращаем приращения к накопленным за это время
+            for key, value in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + value
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении счётчиков: {e}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
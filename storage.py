@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1.0        # как часто изменённые состояния сбрасываются в БД, сек
+CACHE_IDLE_TTL = 10 * 60    # через сколько неактивная запись выгружается из памяти, сек
+STATE_TTL = 24 * 60 * 60    # брошенные состояния удаляются совсем, сек
+
+
+class _Entry:
+    __slots__ = ("state", "data", "touched", "dirty")
+
+    def __init__(self, state=None, data=None, touched=0.0):
+        self.state = state
+        self.data = data or {}
+        self.touched = touched
+        self.dirty = False
+
+
+class SQLiteStorage(BaseStorage):
+    # FSM-хранилище в таблице fsm_states с кэшем в памяти: чтение идёт из кэша,
+    # изменения копятся и пачкой записываются в БД раз в FLUSH_INTERVAL
+    def __init__(self, db):
+        self.db = db
+        self._cache: Dict[str, _Entry] = {}
+        self._task = None
+        self._last_sweep = time.time()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (key.bot_id, key.chat_id, key.user_id, key.thread_id,
+                                               key.business_connection_id, key.destiny))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        k = self._key(key)
+        entry = self._cache.get(k)
+        if entry is None:
+            row = await self.db.fetchone("SELECT state, data, updated_at FROM fsm_states WHERE key=?", (k,),
+                                         label="fsm_load")
+            # Другой обработчик мог успеть заполнить кэш, пока шёл запрос
+            entry = self._cache.get(k)
+            if entry is None:
+                if row and time.time() - row[2] < STATE_TTL:
+                    entry = _Entry(row[0], json.loads(row[1]) if row[1] else {}, row[2])
+                else:
+                    entry = _Entry()
+                self._cache[k] = entry
+        entry.touched = time.time()
+        return entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        entry.dirty = True
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = dict(data)
+        entry.dirty = True
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._entry(key)).data.copy()
+
+    async def flush(self):
+        dirty = [(k, entry) for k, entry in self._cache.items() if entry.dirty]
+        if not dirty:
+            return
+        for _, entry in dirty:
+            entry.dirty = False
+        upserts = [(k, e.state, json.dumps(e.data), e.touched) for k, e in dirty if e.state is not None or e.data]
+        deletes = [(k,) for k, e in dirty if e.state is None and not e.data]
+
+        def op(conn):
+            conn.executemany("INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+                             upserts)
+            conn.executemany("DELETE FROM fsm_states WHERE key=?", deletes)
+        try:
+            await self.db.transaction(op, label="fsm_flush")
+        except Exception:
+            for _, entry in dirty:
+                entry.dirty = True
+            raise
+
+    async def _sweep(self, now):
+        # Выгружаем из памяти давно не используемые записи и удаляем брошенные состояния из БД
+        for k in [k for k, e in self._cache.items() if not e.dirty and now - e.touched > CACHE_IDLE_TTL]:
+            del self._cache[k]
+        await self.db.execute("DELETE FROM fsm_states WHERE updated_at<?", (now - STATE_TTL,), label="fsm_sweep")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+                now = time.time()
+                if now - self._last_sweep > CACHE_IDLE_TTL:
+                    self._last_sweep = now
+                    await self._sweep(now)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении FSM-состояний: {e}")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
@@ -0,0 +1,80 @@
+import logging
+import os
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+
+import metrics
+from delivery import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Лимиты анонимных сообщений: в минуту и размер всплеска
+SENDER_PER_MINUTE = float(os.getenv("FLOOD_SENDER_PER_MINUTE", "20"))  # от одного отправителя всем
+SENDER_BURST = int(os.getenv("FLOOD_SENDER_BURST", "5"))
+PAIR_PER_MINUTE = float(os.getenv("FLOOD_PAIR_PER_MINUTE", "6"))       # от одного отправителя одному владельцу
+PAIR_BURST = int(os.getenv("FLOOD_PAIR_BURST", "3"))
+NOTICE_INTERVAL = 10  # не чаще одного предупреждения отправителю за интервал, сек
+SWEEP_INTERVAL = 60   # как часто удалять простаивающие корзины, сек
+
+
+class FloodControl(BaseMiddleware):
+    # Внутренний middleware для обработчиков с флагом flood_control: лишние сообщения отбрасываются
+    # в памяти, до записи в БД и отправки в Telegram.
+    # Корзины токенов — по отправителю и по паре (отправитель, владелец ссылки из данных FSM)
+    def __init__(self, delivery, sender_rate=SENDER_PER_MINUTE / 60, sender_burst=SENDER_BURST,
+                 pair_rate=PAIR_PER_MINUTE / 60, pair_burst=PAIR_BURST):
+        self.delivery = delivery
+        self.sender_rate = sender_rate
+        self.sender_burst = sender_burst
+        self.pair_rate = pair_rate
+        self.pair_burst = pair_burst
+        self._senders = {}
+        self._pairs = {}
+        self._notified = {}  # отправитель -> monotonic-время последнего предупреждения
+        self._swept = time.monotonic()
+
+    def _bucket(self, buckets, key, rate, burst, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+            bucket.updated = now
+        return bucket
+
+    def _sweep(self, now):
+        # Корзина, которая успела бы наполниться, ничем не отличается от новой
+        for buckets in (self._senders, self._pairs):
+            idle = [key for key, bucket in buckets.items()
+                    if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.capacity]
+            for key in idle:
+                del buckets[key]
+        self._notified = {key: at for key, at in self._notified.items() if now - at < NOTICE_INTERVAL}
+        self._swept = now
+
+    async def __call__(self, handler, event, data):
+        if not get_flag(data, "flood_control") or event.from_user is None:
+            return await handler(event, data)
+        now = time.monotonic()
+        if now - self._swept >= SWEEP_INTERVAL:
+            self._sweep(now)
+
+        sender_id = event.from_user.id
+        owner_id = (await data["state"].get_data()).get("owner_id")
+        sender = self._bucket(self._senders, sender_id, self.sender_rate, self.sender_burst, now)
+        pair = self._bucket(self._pairs, (sender_id, owner_id), self.pair_rate, self.pair_burst, now)
+        wait = max(sender.delay(now), pair.delay(now))
+        if not wait:
+            sender.consume(now)
+            pair.consume(now)
+            return await handler(event, data)
+
+        metrics.throttled.inc("sender" if sender.delay(now) else "pair")
+        if now - self._notified.get(sender_id, 0.0) >= NOTICE_INTERVAL:
+            self._notified[sender_id] = now
+            try:
+                await self.delivery.send_message(
+                    event.chat.id, f"<b>⏳ Слишком много сообщений.</b> Попробуйте через {int(wait) + 1} сек.")
+            except Exception as e:
+                logger.warning(f"Не удалось предупредить отправителя {sender_id} о лимите: {e}")
+        return None
@@ -0,0 +1,34 @@
+import logging
+
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+async def start_server(dp, bot, base_url, path, host, port, secret, ready):
+    # Апдейты принимаются встроенным aiohttp-сервером: запрос без верного
+    # X-Telegram-Bot-Api-Secret-Token отклоняется, остальные получают 200 сразу после
+    # постановки в очередь UpdateExecutor, так что отдельная фоновая задача не нужна.
+    # ready() — готовность для /readyz
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret, handle_in_background=False).register(app, path=path)
+
+    async def healthz(request):
+        return web.json_response({"status": "ok"})
+
+    async def readyz(request):
+        is_ready = ready()
+        return web.json_response({"ready": is_ready}, status=200 if is_ready else 503)
+
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await bot.set_webhook(f"{base_url.rstrip('/')}{path}", secret_token=secret,
+                          allowed_updates=dp.resolve_used_update_types())
+    logger.info(f"Вебхук принимает апдейты на http://{host}:{port}{path}")
+    return runner